@@ -1,37 +1,47 @@
 #!/usr/bin/env python3
 
 from argparse import ArgumentParser
+from parsers.client import DEFAULT_SOCKET, query_daemon
 from pathlib import Path
-import json
-import socket
-import ssl
 import sys
-import urllib.parse
-import urllib.request
-import yaml
 
 
-def format_easy(input=''):
-    parsed = json.loads(input)
-    attrib_list = parsed['attributes']
-    attrib_dict = {}
-    max_length = 0
-    for attrib in attrib_list:
-        if len(attrib['values']) == 1:
-            attrib_dict[attrib['name']] = attrib['values'][0]
-        else:
-            attrib_dict[attrib['name']] = attrib['values']
-        if len(attrib['name']) > max_length:
-            max_length = len(attrib['name'])
-    output = []
-    for key in sorted(attrib_dict):
-        output.append(f'{key:{max_length}} = {attrib_dict[key]}')
-    return "\n".join(output)
+# Works out the attributes released to each requester from the attribute
+# filter files alone, without asking the IdP.
+def offline(args):
+    from parsers import AttributeFilterConfig, ServicesConfig
+    from parsers.config import load_config
+    from parsers.filter_rules import describe_release
+    import csv
 
-def set_defaults(config={}):
-    if 'hostname' not in config:
-        config['hostname'] = socket.getfqdn()
-    return config
+    config = load_config(args.config)
+    services = ServicesConfig(config, [str(config['shibboleth-root'] / 'conf/services.xml')])
+    attr_filter = AttributeFilterConfig(config, services.get_files('attr-filter'))
+
+    if args.requesters:
+        f = sys.stdin if args.requesters == '-' else open(args.requesters)
+        writer = csv.writer(sys.stdout)
+        writer.writerow(['requester', 'released', 'conditional'])
+        for line in f:
+            requester = line.strip()
+            if not requester:
+                continue
+            _, released = attr_filter.simulate(requester, args.principal, args.group)
+            writer.writerow([
+                requester,
+                ' '.join(sorted(a for a, r in released.items() if r is True)),
+                ' '.join(sorted(a for a, r in released.items() if r is not True)),
+            ])
+        return
+
+    requester = args.requester
+    if requester == 'test' and 'test-sp' in config:
+        requester = config['test-sp']
+    policies, released = attr_filter.simulate(requester, args.principal, args.group)
+    for id, applies in policies:
+        print(f'Policy {id}' + ('' if applies else ' (might apply)'))
+    for attr in sorted(released):
+        print(f'{attr}: {describe_release(released[attr])}')
 
 
 if __name__ == '__main__':
@@ -40,40 +50,55 @@ if __name__ == '__main__':
     ap.add_argument('--config', type=open,
                     default=str(script_dir / 'config.yml'),
                     help='YAML file with configuration options.')
-    ap.add_argument('-n', '--principal', type=str, required=True,
-                    help='Required: Username to use as principal')
-    ap.add_argument('-r', '--requester', type=str, required=True,
+    ap.add_argument('-n', '--principal', type=str, default=None,
+                    help='Required: Username to use as principal (optional with --offline)')
+    ap.add_argument('-r', '--requester', type=str, default=None,
                     help='Required: Entity ID of relying party')
     ap.add_argument('-f', '--format', type=str, nargs='?',
                     choices=['saml1', 'saml2', 'json', 'easy'],
                     default='saml2',
                     help='Output format (default: saml2)')
+    ap.add_argument('--offline', action='store_true',
+                    help='Work out released attributes from the attribute filter files, without asking the IdP')
+    ap.add_argument('--requesters', default=None, metavar='FILE',
+                    help='With --offline, read entity IDs one per line from this file (- for stdin) instead of -r, and print CSV')
+    ap.add_argument('-g', '--group', default=None, nargs='+',
+                    help='With --offline, the entity groups the requester belongs to (otherwise InEntityGroup rules can’t be decided)')
+    ap.add_argument('--socket', default=DEFAULT_SOCKET,
+                    help=f'Query daemon socket to try first (default: {DEFAULT_SOCKET})')
+    ap.add_argument('--no-daemon', action='store_true',
+                    help='Don’t try the query daemon; always query in this process')
     args = ap.parse_args()
-    config = yaml.safe_load(args.config)
-    config = set_defaults(config)
 
-    base = f"https://{config['hostname']}/idp/profile/admin/resolvertest"
-    requester = args.requester
-    format = args.format if args.format != 'easy' else 'json'
-    if args.requester == 'test' and 'test-sp' in config:
-        requester = config['test-sp']
-        format = 'json'
-    query = {
-        'principal': args.principal,
-        'requester': requester,
-        format: True,
-    }
-    url = f'{base}?{urllib.parse.urlencode(query)}'
+    if args.offline:
+        if not args.requester and not args.requesters:
+            ap.error('--offline requires -r/--requester or --requesters')
+        offline(args)
+        sys.exit(0)
+    if not args.principal or not args.requester:
+        ap.error('-n/--principal and -r/--requester are required')
 
-    cx = ssl.create_default_context()
-    cx.verify_mode = ssl.CERT_OPTIONAL
-    cx.check_hostname = False
+    if not args.no_daemon:
+        request = {
+            'command': 'attributes',
+            'config': str(Path(args.config.name).resolve()),
+            'principal': args.principal,
+            'requester': args.requester,
+            'format': args.format,
+        }
+        response = query_daemon(args.socket, request)
+        if response is not None:
+            print(response, end='')
+            sys.exit(0)
 
-    response = urllib.request.urlopen(url, context=cx)
-    result = response.read().decode()
-    if args.format == 'easy' or args.requester == 'test':
-        try:
-            result = format_easy(result)
-        except json.JSONDecodeError:
-            sys.exit('ERROR: Could not parse response from IdP')
+    # Deferred until we know the daemon can’t answer.
+    from parsers.resolvertest import resolver_test
+    import json
+    import yaml
+
+    config = yaml.safe_load(args.config)
+    try:
+        result = resolver_test(config, args.principal, args.requester, args.format)
+    except json.JSONDecodeError:
+        sys.exit('ERROR: Could not parse response from IdP')
     print(result)
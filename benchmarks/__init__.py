@@ -0,0 +1,7 @@
+#!/usr/bin/env python3
+
+from .generators import (
+    write_access_log,
+    write_idp_log,
+    write_shibboleth_root,
+)
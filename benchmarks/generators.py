@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+
+# Generators for synthetic IdP logs, webserver logs, and a fake
+# `shibboleth-root` directory, so the benchmarks have realistic input
+# without needing access to a production IdP.
+
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+import base64
+import gzip
+import random
+
+
+START_TIME = datetime(2024, 1, 1, 0, 0, 0)
+
+NOISE_MESSAGES = [
+    ('INFO', 'net.shibboleth.idp.session.impl.StorageBackedSessionManager', 327,
+     "Created new session {session} for principal {user}"),
+    ('INFO', 'net.shibboleth.idp.authn.impl.ValidateUsernamePasswordAgainstLDAP', 152,
+     "Profile Action ValidateUsernamePasswordAgainstLDAP: Login by '{user}' succeeded"),
+    ('WARN', 'org.opensaml.saml.saml2.binding.security.impl.SAML2HTTPRedirectDeflateSignatureSecurityHandler', 94,
+     'Message was not signed, skipping signature check'),
+    ('INFO', 'org.opensaml.saml.metadata.resolver.impl.AbstractReloadingMetadataResolver', 350,
+     'Metadata Resolver FileBackedHTTPMetadataResolver InCommon: Next refresh cycle for metadata provider will occur on {time}'),
+    ('DEBUG', 'net.shibboleth.idp.saml.profile.impl.PopulateBindingAndEndpointContexts', 388,
+     'Profile Action PopulateBindingAndEndpointContexts: Resolved endpoint'),
+    ('INFO', 'org.opensaml.saml.metadata.resolver.impl.AbstractMetadataResolver', 621,
+     "Ignoring NameIDFormat metadata that includes the 'unspecified' format"),
+]
+
+BROWSERS = [
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0 Safari/537.36',
+    'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.2 Safari/605.1.15',
+    'Mozilla/5.0 (X11; Linux x86_64; rv:121.0) Gecko/20100101 Firefox/121.0',
+    'Mozilla/5.0 (iPhone; CPU iPhone OS 17_2 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Mobile/15E148',
+]
+
+RELEASED_ATTRIBUTES = ['uid', 'mail', 'displayName', 'eduPersonPrincipalName', 'eduPersonAffiliation']
+
+
+def make_principals(count):
+    return [f'user{i:05d}' for i in range(count)]
+
+
+def make_requesters(count):
+    return [f'https://sp{i:04d}.example.edu/shibboleth' for i in range(count)]
+
+
+def make_ips(count, rng):
+    return [f'10.{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(1, 255)}'
+            for _ in range(count)]
+
+
+def _open(path, gz):
+    if gz:
+        return gzip.open(path, 'wt')
+    return open(path, 'w')
+
+
+def _audit_message(time, user, entity_id, browser, rng):
+    fields = [''] * 22
+    fields[0] = time.strftime('%Y%m%dT%H%M%SZ')
+    fields[1] = 'urn:oasis:names:tc:SAML:2.0:bindings:HTTP-Redirect'
+    fields[2] = f'_{rng.getrandbits(64):016x}'
+    fields[3] = user
+    fields[4] = entity_id
+    fields[5] = 'https://idp.example.edu/idp/shibboleth'
+    fields[8] = ','.join(RELEASED_ATTRIBUTES)
+    fields[20] = browser
+    return '|'.join(fields)
+
+
+# Writes a synthetic `idp-process.log`, returning a dict of line counts.
+# Ratios are the share of lines that are audit (SSO) lines and LDAP login
+# lines; everything else is noise from other modules.
+def write_idp_log(path, lines=100000, audit_ratio=0.3, login_ratio=0.1,
+                  principals=1000, requesters=100, ips=500, days=1,
+                  gz=False, seed=0):
+    rng = random.Random(seed)
+    users = make_principals(principals)
+    sps = make_requesters(requesters)
+    addrs = make_ips(ips, rng)
+    step = timedelta(days=days) / max(lines, 1)
+    counts = {'lines': 0, 'audit': 0, 'login': 0, 'noise': 0}
+    time = START_TIME
+    with _open(path, gz) as f:
+        for _ in range(lines):
+            time += step
+            stamp = time.strftime('%Y-%m-%d %H:%M:%S,') + f'{time.microsecond // 1000:03d}'
+            ip_addr = rng.choice(addrs)
+            user = rng.choice(users)
+            roll = rng.random()
+            if roll < audit_ratio:
+                message = _audit_message(time, user, rng.choice(sps), rng.choice(BROWSERS), rng)
+                line = f'{stamp} - {ip_addr} - INFO [Shibboleth-Audit.SSO:283] - {message}'
+                counts['audit'] += 1
+            elif roll < audit_ratio + login_ratio:
+                status = 'succeeded' if rng.random() < 0.9 else 'failed'
+                line = (f'{stamp} - {ip_addr} - INFO [net.shibboleth.idp.authn.impl.LDAPCredentialValidator:166]'
+                        f" - Credential Validator ldap: Login by '{user}' {status}")
+                counts['login'] += 1
+            else:
+                level, module, lineno, message = rng.choice(NOISE_MESSAGES)
+                message = message.format(session=f'{rng.getrandbits(64):016x}', user=user, time=stamp)
+                line = f'{stamp} - {ip_addr} - {level} [{module}:{lineno}] - {message}'
+                counts['noise'] += 1
+            f.write(line + '\n')
+            counts['lines'] += 1
+    return counts
+
+
+# Writes a synthetic Apache access log in combined format, as read by
+# `WebserverLog`. A share of clients get stuck in a POST loop, repeating
+# the same request several times, so `detect_loops()` has work to do.
+def write_access_log(path, lines=100000, ips=500, loop_ratio=0.05,
+                     skip_ratio=0.2, gz=False, seed=0):
+    from parsers.webserver import WebserverLog
+
+    rng = random.Random(seed)
+    addrs = make_ips(ips, rng)
+    time = datetime(2024, 1, 1, tzinfo=timezone(timedelta(hours=-5)))
+    counts = {'lines': 0, 'loops': 0}
+    with _open(path, gz) as f:
+        while counts['lines'] < lines:
+            time += timedelta(seconds=rng.random())
+            ip_addr = rng.choice(addrs)
+            browser = rng.choice(BROWSERS)
+            stamp = time.strftime('%d/%b/%Y:%H:%M:%S %z')
+            roll = rng.random()
+            if roll < skip_ratio:
+                request = ('GET', rng.choice(WebserverLog.SKIP_PAGES), 200)
+                repeat = 1
+            elif roll < skip_ratio + loop_ratio:
+                request = ('POST', '/idp/profile/SAML2/POST/SSO', 200)
+                repeat = rng.randrange(3, 10)
+                counts['loops'] += 1
+            else:
+                binding = rng.choice(['Redirect', 'POST'])
+                query = rng.choice(['?SAMLRequest=fZJNT8MwDIb', '?execution=e1s1', '?execution=e1s2', ''])
+                request = (rng.choice(['GET', 'POST']), f'/idp/profile/SAML2/{binding}/SSO{query}', 200)
+                repeat = 1
+            method, uri, status = request
+            for _ in range(repeat):
+                f.write(f'{ip_addr} - - [{stamp}] "{method} {uri} HTTP/1.1" {status} 3972 '
+                        f'"https://sp.example.edu/" "{browser}"\n')
+                counts['lines'] += 1
+    return counts
+
+
+# Returns a list of base64-encoded DER certificates, self-signed, for
+# embedding in metadata. Generating keys is slow, so files share these.
+def make_certificates(count=4, seed=0):
+    from cryptography import x509
+    from cryptography.hazmat.primitives import hashes
+    from cryptography.hazmat.primitives.asymmetric import ec
+    from cryptography.hazmat.primitives.serialization import Encoding
+    from cryptography.x509.oid import NameOID
+
+    now = datetime.now(tz=timezone.utc)
+    certs = []
+    for i in range(count):
+        key = ec.generate_private_key(ec.SECP256R1())
+        name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, f'sp{seed}-{i}.example.edu')])
+        cert = (x509.CertificateBuilder()
+                .subject_name(name)
+                .issuer_name(name)
+                .public_key(key.public_key())
+                .serial_number(x509.random_serial_number())
+                .not_valid_before(now - timedelta(days=365))
+                .not_valid_after(now + timedelta(days=365 * (i + 1)))
+                .sign(key, hashes.SHA256()))
+        certs.append(base64.standard_b64encode(cert.public_bytes(Encoding.DER)).decode())
+    return certs
+
+
+def _metadata_xml(entity_id, certs, valid_until):
+    keys = ''.join(f'''
+      <md:KeyDescriptor use="signing">
+        <ds:KeyInfo><ds:X509Data><ds:X509Certificate>{cert}</ds:X509Certificate></ds:X509Data></ds:KeyInfo>
+      </md:KeyDescriptor>''' for cert in certs)
+    return f'''<?xml version="1.0" encoding="UTF-8"?>
+<md:EntityDescriptor xmlns:md="urn:oasis:names:tc:SAML:2.0:metadata"
+    xmlns:ds="http://www.w3.org/2000/09/xmldsig#"
+    entityID="{entity_id}" validUntil="{valid_until}">
+  <md:SPSSODescriptor protocolSupportEnumeration="urn:oasis:names:tc:SAML:2.0:protocol">{keys}
+    <md:NameIDFormat>urn:oasis:names:tc:SAML:2.0:nameid-format:transient</md:NameIDFormat>
+    <md:AssertionConsumerService Binding="urn:oasis:names:tc:SAML:2.0:bindings:HTTP-POST"
+        Location="{entity_id.rsplit('/', 1)[0]}/Shibboleth.sso/SAML2/POST" index="1"/>
+  </md:SPSSODescriptor>
+</md:EntityDescriptor>
+'''
+
+
+# Builds a fake `shibboleth-root` with `conf/services.xml`, metadata
+# providers, an attribute filter with one policy per SP, an attribute
+# resolver, and one metadata file per SP. Returns a dict of counts.
+def write_shibboleth_root(root, metadata_files=200, attributes=40,
+                          certs_per_file=2, seed=0):
+    root = Path(root)
+    (root / 'conf').mkdir(parents=True, exist_ok=True)
+    (root / 'metadata').mkdir(parents=True, exist_ok=True)
+    rng = random.Random(seed)
+    certs = make_certificates(seed=seed)
+    valid_until = (datetime.now(tz=timezone.utc) + timedelta(days=30)).strftime('%Y-%m-%dT%H:%M:%SZ')
+    sps = make_requesters(metadata_files)
+    attr_ids = RELEASED_ATTRIBUTES + [f'attr{i:03d}' for i in range(max(attributes - len(RELEASED_ATTRIBUTES), 0))]
+
+    (root / 'conf/services.xml').write_text('''<?xml version="1.0" encoding="UTF-8"?>
+<beans xmlns="http://www.springframework.org/schema/beans"
+    xmlns:util="http://www.springframework.org/schema/util">
+  <util:list id="shibboleth.MetadataResolverResources">
+    <value>%{idp.home}/conf/metadata-providers.xml</value>
+  </util:list>
+  <util:list id="shibboleth.AttributeFilterResources">
+    <value>%{idp.home}/conf/attribute-filter.xml</value>
+  </util:list>
+  <util:list id="shibboleth.AttributeResolverResources">
+    <value>%{idp.home}/conf/attribute-resolver.xml</value>
+  </util:list>
+</beans>
+''')
+
+    providers = []
+    for i, entity_id in enumerate(sps):
+        filename = f'sp{i:04d}.xml'
+        chosen = [rng.choice(certs) for _ in range(certs_per_file)]
+        (root / 'metadata' / filename).write_text(_metadata_xml(entity_id, chosen, valid_until))
+        providers.append(f'  <MetadataProvider id="sp{i:04d}" xsi:type="FilesystemMetadataProvider"'
+                         f' metadataFile="%{{idp.home}}/metadata/{filename}"/>')
+    (root / 'metadata/idp-metadata.xml').write_text(
+        _metadata_xml('https://idp.example.edu/idp/shibboleth', certs[:1], valid_until))
+    (root / 'conf/metadata-providers.xml').write_text(f'''<?xml version="1.0" encoding="UTF-8"?>
+<MetadataProvider id="ShibbolethMetadata" xsi:type="ChainingMetadataProvider"
+    xmlns="urn:mace:shibboleth:2.0:metadata"
+    xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">
+''' + '\n'.join(providers) + '\n</MetadataProvider>\n')
+
+    write_attribute_filter(root / 'conf/attribute-filter.xml', sps, attr_ids, rng)
+
+    definitions = []
+    for attr_id in attr_ids:
+        definitions.append(f'''  <AttributeDefinition id="{attr_id}" xsi:type="Simple">
+    <InputDataConnector ref="myLDAP" attributeNames="{attr_id}"/>
+  </AttributeDefinition>''')
+    (root / 'conf/attribute-resolver.xml').write_text(f'''<?xml version="1.0" encoding="UTF-8"?>
+<AttributeResolver xmlns="urn:mace:shibboleth:2.0:resolver"
+    xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">
+''' + '\n'.join(definitions) + '''
+  <DataConnector id="myLDAP" xsi:type="LDAPDirectory" ldapURL="ldap://ldap.example.edu"
+      baseDN="dc=example,dc=edu" principal="cn=idp" principalCredential="secret">
+    <FilterTemplate>(uid=$resolutionContext.principal)</FilterTemplate>
+  </DataConnector>
+</AttributeResolver>
+''')
+    return {'metadata_files': metadata_files + 1, 'policies': len(sps), 'attributes': len(attr_ids)}
+
+
+# Writes an `attribute-filter.xml` with one policy per requester, each
+# releasing a random handful of attributes.
+def write_attribute_filter(path, requesters, attr_ids, rng):
+    policies = []
+    for i, entity_id in enumerate(requesters):
+        rules = ''.join(f'''
+    <AttributeRule attributeID="{attr_id}">
+      <PermitValueRule xsi:type="ANY"/>
+    </AttributeRule>''' for attr_id in rng.sample(attr_ids, min(len(attr_ids), rng.randrange(2, 8))))
+        policies.append(f'''  <AttributeFilterPolicy id="policy{i:05d}">
+    <PolicyRequirementRule xsi:type="Requester" value="{entity_id}"/>{rules}
+  </AttributeFilterPolicy>''')
+    Path(path).write_text('''<?xml version="1.0" encoding="UTF-8"?>
+<AttributeFilterPolicyGroup id="ShibbolethFilterPolicy"
+    xmlns="urn:mace:shibboleth:2.0:afp"
+    xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">
+''' + '\n'.join(policies) + '\n</AttributeFilterPolicyGroup>\n')
+    return len(policies)
@@ -0,0 +1,330 @@
+#!/usr/bin/env python3
+
+# Benchmark scenarios. Each one is a function that takes the working
+# directory (as prepared by `prepare()`) and its manifest, does its work,
+# and returns the number of items it processed. Run this module directly
+# with a scenario name and working directory to time a single scenario in
+# a fresh interpreter; it prints the measurements as JSON. Run it with
+# `--prepare`, the working directory, scale, and seed to generate data.
+
+from argparse import Namespace
+from contextlib import redirect_stdout
+from pathlib import Path
+import importlib.util
+import io
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import time
+
+from .generators import (
+    RELEASED_ATTRIBUTES,
+    make_requesters,
+    write_access_log,
+    write_attribute_filter,
+    write_idp_log,
+    write_shibboleth_root,
+)
+
+REPO_DIR = Path(__file__).resolve().parents[1]
+
+
+# Raised by a scenario that can’t run here, such as for lack of a package.
+class ScenarioSkipped(Exception):
+    pass
+
+# Base sizes, multiplied by `--scale`.
+SIZES = {
+    'idp_lines': 200000,
+    'access_lines': 100000,
+    'metadata_files': 200,
+    'filter_policies': 20000,
+}
+
+
+# Generates all input data into `workdir` and writes its manifest.
+def prepare(workdir, scale=1.0, seed=0):
+    workdir = Path(workdir)
+    workdir.mkdir(parents=True, exist_ok=True)
+    idp_lines = int(SIZES['idp_lines'] * scale)
+    manifest = {
+        'scale': scale,
+        'seed': seed,
+        'idp_log': write_idp_log(workdir / 'idp-process.log', lines=idp_lines, seed=seed),
+        'idp_log_gz': write_idp_log(workdir / 'idp-process.log.gz', lines=idp_lines, gz=True, seed=seed),
+        'access_log': write_access_log(workdir / 'access.log', lines=int(SIZES['access_lines'] * scale), seed=seed),
+        'shibboleth_root': write_shibboleth_root(
+            workdir / 'shibboleth-idp',
+            metadata_files=int(SIZES['metadata_files'] * scale),
+            seed=seed),
+        'attribute_filter': {'policies': write_attribute_filter(
+            workdir / 'attribute-filter-large.xml',
+            make_requesters(int(SIZES['filter_policies'] * scale)),
+            RELEASED_ATTRIBUTES + [f'attr{i:03d}' for i in range(40)],
+            random.Random(seed))},
+    }
+    (workdir / 'config.yml').write_text(
+        f"shibboleth-root: {workdir / 'shibboleth-idp'}\nmetadata-ignore: []\nxmllint: false\n")
+    with open(workdir / 'manifest.json', 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def _run_script(script, *args):
+    command = [sys.executable, str(REPO_DIR / script)] + [str(a) for a in args]
+    subprocess.run(command, check=True, stdout=subprocess.DEVNULL, cwd=REPO_DIR)
+
+
+# Runs a script under `python -X importtime` and returns the number of
+# modules it imported and the total time spent importing them.
+def _import_time(script, *args):
+    command = [sys.executable, '-X', 'importtime', str(REPO_DIR / script)] + [str(a) for a in args]
+    result = subprocess.run(command, check=True, stdout=subprocess.DEVNULL,
+                            stderr=subprocess.PIPE, text=True, cwd=REPO_DIR)
+    modules = 0
+    microseconds = 0
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        modules += 1
+        microseconds += int(line.split('|')[0].split(':')[1])
+    return modules, {'import_seconds': microseconds / 1e6}
+
+
+def _check_config_module():
+    spec = importlib.util.spec_from_file_location('check_config', REPO_DIR / 'check-config.py')
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def _check_config(workdir):
+    with open(workdir / 'config.yml') as f:
+        args = Namespace(config=f, cert=True)
+        return _check_config_module().get_config(args)
+
+
+def logscan_all(workdir, manifest):
+    _run_script('logscan.py', '--no-daemon', '-f', workdir / 'idp-process.log')
+    return manifest['idp_log']['lines']
+
+
+def logscan_gz(workdir, manifest):
+    _run_script('logscan.py', '--no-daemon', '-f', workdir / 'idp-process.log.gz')
+    return manifest['idp_log_gz']['lines']
+
+
+def logscan_gz_serial(workdir, manifest):
+    _run_script('logscan.py', '--no-daemon', '-f', workdir / 'idp-process.log.gz', '--no-prefetch', '--decompressor', 'python')
+    return manifest['idp_log_gz']['lines']
+
+
+def logscan_principal(workdir, manifest):
+    _run_script('logscan.py', '--no-daemon', '-f', workdir / 'idp-process.log', '-n', 'user00001')
+    return manifest['idp_log']['lines']
+
+
+def logscan_detail(workdir, manifest):
+    _run_script('logscan.py', '--no-daemon', '-f', workdir / 'idp-process.log',
+                '-n', 'user00001', 'user00002',
+                '-r', 'https://sp0001.example.edu/shibboleth')
+    return manifest['idp_log']['lines']
+
+
+def logscan_daily(workdir, manifest):
+    _run_script('logscan.py', '--no-daemon', '-f', workdir / 'idp-process.log',
+                '-r', 'https://sp0001.example.edu/shibboleth', '-d')
+    return manifest['idp_log']['lines']
+
+
+def check_config_script(workdir, manifest):
+    _run_script('check-config.py', '--no-daemon', '--config', workdir / 'config.yml', '-c')
+    return manifest['shibboleth_root']['metadata_files']
+
+
+def check_config_services(workdir, manifest):
+    from parsers import ServicesConfig
+
+    config = _check_config(workdir)
+    ServicesConfig(config, [str(config['shibboleth-root'] / 'conf/services.xml')])
+    return 1
+
+
+def check_config_metadata(workdir, manifest):
+    from parsers import MetadataResolverConfig, ServicesConfig
+
+    config = _check_config(workdir)
+    services = ServicesConfig(config, [str(config['shibboleth-root'] / 'conf/services.xml')])
+    metadata = MetadataResolverConfig(config, services.get_files('metadata'))
+    with redirect_stdout(io.StringIO()):
+        metadata.check_files()
+    return manifest['shibboleth_root']['metadata_files']
+
+
+# Checks that the config and metadata files are well-formed, then loads
+# the metadata, with the given XML backend.
+def _validate_metadata(workdir, manifest, backend, xmllint=False):
+    from parsers import MetadataResolverConfig, ServicesConfig
+    from parsers.config import validate_xml
+    from parsers.stats import RunStats
+
+    config = _check_config(workdir)
+    config['xml-backend'] = backend
+    config['xmllint'] = xmllint
+    services = ServicesConfig(config, [str(config['shibboleth-root'] / 'conf/services.xml')])
+    validate_xml(config, RunStats(enabled=False))
+    metadata = MetadataResolverConfig(config, services.get_files('metadata'))
+    metadata.load_files()
+    return manifest['shibboleth_root']['metadata_files']
+
+
+# The xmllint binary checks each file, then ElementTree parses it again.
+def validate_metadata_xmllint(workdir, manifest):
+    import shutil
+
+    xmllint = shutil.which('xmllint')
+    if not xmllint:
+        raise ScenarioSkipped('xmllint is not installed')
+    return _validate_metadata(workdir, manifest, 'etree', xmllint)
+
+
+# One lxml parse per file both checks it and builds the tree.
+def validate_metadata_lxml(workdir, manifest):
+    if importlib.util.find_spec('lxml') is None:
+        raise ScenarioSkipped('lxml is not installed')
+    return _validate_metadata(workdir, manifest, 'lxml')
+
+
+def check_config_attributes(workdir, manifest):
+    from parsers import AttributeFilterConfig, AttributeResolverConfig, ServicesConfig
+
+    config = _check_config(workdir)
+    services = ServicesConfig(config, [str(config['shibboleth-root'] / 'conf/services.xml')])
+    attr_filter = AttributeFilterConfig(config, services.get_files('attr-filter'))
+    released = attr_filter.get_released()
+    attr_resolver = AttributeResolverConfig(config, services.get_files('attr-resolver'))
+    resolvable = set(attr_resolver.attributes())
+    missing = [attr for attr in released if attr not in resolvable]
+    if missing:
+        raise RuntimeError(f'Generated config has unresolvable attributes {missing}')
+    problems = attr_resolver.graph().problems()
+    if problems:
+        raise RuntimeError(f'Generated config has unresolvable dependencies {problems}')
+    return manifest['shibboleth_root']['policies']
+
+
+def parse_attribute_filter(workdir, manifest):
+    from parsers import AttributeFilterConfig
+
+    config = _check_config(workdir)
+    AttributeFilterConfig(config, [str(workdir / 'attribute-filter-large.xml')])
+    return manifest['attribute_filter']['policies']
+
+
+def simulate_release(workdir, manifest):
+    from parsers import AttributeFilterConfig
+
+    config = _check_config(workdir)
+    attr_filter = AttributeFilterConfig(config, [str(workdir / 'attribute-filter-large.xml')])
+    requesters = [f'https://sp{i:04d}.example.edu/shibboleth' for i in range(manifest['attribute_filter']['policies'])]
+    for requester in requesters:
+        attr_filter.simulate(requester, 'user00001', [])
+    return len(requesters)
+
+
+def parse_idp_log(workdir, manifest):
+    from parsers import ShibbolethLog
+
+    log = ShibbolethLog(principal=None, requester=None, daily=False, prefetch=False)
+    log.load(str(workdir / 'idp-process.log'))
+    return manifest['idp_log']['lines']
+
+
+def startup_logscan(workdir, manifest):
+    (workdir / 'empty.log').touch()
+    return _import_time('logscan.py', '--no-daemon', '-f', workdir / 'empty.log', '-n', 'jsmith')
+
+
+def startup_check_config(workdir, manifest):
+    return _import_time('check-config.py', '--help')
+
+
+def startup_attributes(workdir, manifest):
+    return _import_time('attributes.py', '--help')
+
+
+def webserver_loops(workdir, manifest):
+    from parsers import WebserverLog
+
+    with redirect_stdout(io.StringIO()):
+        log = WebserverLog(str(workdir / 'access.log'))
+        log.command_loops()
+    return manifest['access_log']['lines']
+
+
+# Name => (function, unit of the items it returns)
+SCENARIOS = {
+    'logscan-all': (logscan_all, 'lines'),
+    'logscan-gz': (logscan_gz, 'lines'),
+    'logscan-gz-serial': (logscan_gz_serial, 'lines'),
+    'logscan-principal': (logscan_principal, 'lines'),
+    'logscan-detail': (logscan_detail, 'lines'),
+    'logscan-daily': (logscan_daily, 'lines'),
+    'check-config': (check_config_script, 'files'),
+    'check-config-services': (check_config_services, 'files'),
+    'check-config-metadata': (check_config_metadata, 'files'),
+    'check-config-attributes': (check_config_attributes, 'policies'),
+    'validate-metadata-xmllint': (validate_metadata_xmllint, 'files'),
+    'validate-metadata-lxml': (validate_metadata_lxml, 'files'),
+    'parse-attribute-filter': (parse_attribute_filter, 'policies'),
+    'parse-idp-log': (parse_idp_log, 'lines'),
+    'simulate-release': (simulate_release, 'requesters'),
+    'startup-logscan': (startup_logscan, 'modules'),
+    'startup-check-config': (startup_check_config, 'modules'),
+    'startup-attributes': (startup_attributes, 'modules'),
+    'webserver-loops': (webserver_loops, 'lines'),
+}
+
+
+# Runs one scenario in this process and returns its measurements.
+# Peak RSS includes any child processes the scenario started (in KiB).
+# A scenario may return (items, {extra measurements}) instead of items.
+def measure(name, workdir):
+    workdir = Path(workdir)
+    with open(workdir / 'manifest.json') as f:
+        manifest = json.load(f)
+    function, unit = SCENARIOS[name]
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    items = function(workdir, manifest)
+    wall = time.perf_counter() - wall
+    extra = {}
+    if isinstance(items, tuple):
+        items, extra = items
+    cpu = time.process_time() - cpu
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return {
+        'seconds': wall,
+        'cpu': cpu + children.ru_utime + children.ru_stime,
+        'items': items,
+        'unit': unit,
+        'throughput': items / wall if wall else None,
+        'peak_rss_kb': max(own.ru_maxrss, children.ru_maxrss),
+        **extra,
+    }
+
+
+if __name__ == '__main__':
+    if sys.argv[1] == '--prepare':
+        prepare(sys.argv[2], scale=float(sys.argv[3]), seed=int(sys.argv[4]))
+        sys.exit(0)
+    os.chdir(REPO_DIR)
+    sys.path.insert(0, str(REPO_DIR))
+    try:
+        print(json.dumps(measure(sys.argv[1], sys.argv[2])))
+    except ScenarioSkipped as e:
+        print(json.dumps({'skipped': str(e)}))
@@ -1,43 +1,35 @@
 #!/usr/bin/env python3
 
 from argparse import ArgumentParser
-from parsers import (
-    AttributeFilterConfig,
-    AttributeResolverConfig,
-    MetadataResolverConfig,
-    ServicesConfig
-)
+from parsers.client import DEFAULT_SOCKET, query_daemon
 from pathlib import Path
-import subprocess
-import yaml
 
 
+# The parsers are only imported once we know the daemon can’t answer.
 def get_config(args):
-    config = yaml.safe_load(args.config)
-    config['check_expiry'] = args.cert
-    # Set up defaults.
-    if 'shibboleth-root' not in config:
-        config['shibboleth-root'] = '/opt/shibboleth-idp'
-    config['shibboleth-root'] = Path(config['shibboleth-root']).resolve()
-    if 'properties' not in config:
-        config['properties'] = {}
-    if 'idp.home' not in config['properties']:
-        config['properties']['idp.home'] = str(config['shibboleth-root'])
-    if 'metadata-require' not in config:
-        config['metadata-require'] = ['%{idp.home}/metadata/idp-metadata.xml']
-    if 'xmllint' not in config:
-        config['xmllint'] = '/usr/bin/xmllint'
-    return config
+    from parsers.config import load_config
 
+    return load_config(args.config, check_expiry=args.cert)
 
-def xmllint(config):
-    if not config['xmllint']:
+
+def check(config, stats, args):
+    from parsers import IdPConfig
+    from parsers.config import validate_xml
+
+    if args.refresh:
+        IdPConfig(config, stats).metadata.check_refresh(
+            args.refresh_state, args.download, args.concurrency, args.timeout)
+        return
+    if args.depends or args.impact:
+        idp = IdPConfig(config, stats)
+        if args.depends:
+            idp.report_depends(args.depends)
+        if args.impact:
+            idp.report_impact(args.impact)
         return
-    for dir in ['conf', 'metadata']:
-        files = config['shibboleth-root'].glob(f'{dir}/**/*.xml')
-        for file in files:
-            result = subprocess.run([config['xmllint'], '--noout', file])
-            result.check_returncode()
+    with stats.phase('validate xml'):
+        validate_xml(config, stats)
+    IdPConfig(config, stats).check()
 
 
 if __name__ == '__main__':
@@ -48,28 +40,53 @@ if __name__ == '__main__':
                     help='YAML file with configuration options.')
     ap.add_argument('-c', '--cert', action='store_true',
                     help='Also check for metadata and cert expiration.')
+    ap.add_argument('--depends', default=None, nargs='+', metavar='ATTRIBUTE',
+                    help='Show the data connectors these attributes rely on, instead of checking.')
+    ap.add_argument('--impact', default=None, nargs='+', metavar='CONNECTOR',
+                    help='Show the released attributes that fail if these data connectors are down, instead of checking.')
+    ap.add_argument('--refresh', action='store_true',
+                    help='Check FileBackedHTTPMetadataProvider backing files against their metadataURL, instead of checking.')
+    ap.add_argument('--refresh-state', default=None, metavar='FILE',
+                    help='With --refresh, JSON file of ETags and Last-Modified dates to send back and update.')
+    ap.add_argument('--download', default=None, metavar='DIR',
+                    help='With --refresh, save changed metadata to this directory.')
+    ap.add_argument('--concurrency', default=8, type=int, metavar='N',
+                    help='With --refresh, how many sources to ask at once (default: 8).')
+    ap.add_argument('--timeout', default=30, type=float, metavar='SECONDS',
+                    help='With --refresh, how long to wait for each server (default: 30).')
+    ap.add_argument('--stats', default=None, metavar='FILE',
+                    help='Write phase timings and counts as JSON to this file (- for stderr).')
+    ap.add_argument('--profile', default=None, metavar='FILE',
+                    help='Write cProfile data for the run to this file.')
+    ap.add_argument('--socket', default=DEFAULT_SOCKET,
+                    help=f'Query daemon socket to try first (default: {DEFAULT_SOCKET}).')
+    ap.add_argument('--no-daemon', action='store_true',
+                    help='Don’t try the query daemon; always check in this process.')
     args = ap.parse_args()
-    config = get_config(args)
+    if args.concurrency < 1:
+        print('The --concurrency option must be at least 1')
+        exit(1)
+    if args.download:
+        Path(args.download).mkdir(parents=True, exist_ok=True)
 
-    xmllint(config)
+    if not args.no_daemon and not args.stats and not args.profile and not (args.depends or args.impact or args.refresh):
+        request = {
+            'command': 'check-config',
+            'config': str(Path(args.config.name).resolve()),
+            'cert': args.cert,
+        }
+        response = query_daemon(args.socket, request)
+        if response is not None:
+            print(response, end='')
+            exit(0)
 
-    services_filename = str(config['shibboleth-root'] / 'conf/services.xml')
-    services = ServicesConfig(config, [services_filename])
+    from parsers import RunStats
+    from parsers.stats import profiled
 
-    metadata = MetadataResolverConfig(config, services.get_files('metadata'))
-    metadata.check_files()
+    config = get_config(args)
+    stats = RunStats(enabled=bool(args.stats))
 
-    attr_filter = AttributeFilterConfig(
-        config,
-        services.get_files('attr-filter'))
-    released_attrs = attr_filter.get_released()
-    attr_resolver = AttributeResolverConfig(
-        config,
-        services.get_files('attr-resolver'))
-    for attr, ids in released_attrs.items():
-        if attr not in attr_resolver.stanzas:
-            print(f'ERROR: Unresolvable attribute {attr} used by {ids}')
-    print('All released attributes are resolvable')
-    for attr in attr_resolver.stanzas:
-        if attr not in released_attrs:
-            print(f'Attribute {attr} is resolvable but unused')
+    with profiled(args.profile):
+        check(config, stats, args)
+    if args.stats:
+        stats.write(args.stats)
@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+
+from argparse import ArgumentParser
+from parsers import QueryDaemon
+from parsers.client import DEFAULT_SOCKET
+from pathlib import Path
+import os
+import signal
+import sys
+
+
+if __name__ == '__main__':
+    script_dir = Path(__file__).resolve().parents[0]
+    ap = ArgumentParser(
+        description='''
+            Keeps IdP config and logs parsed in memory and answers queries
+            from logscan.py, check-config.py, and attributes.py, which try
+            it first and fall back to doing the work themselves.
+        ''',
+    )
+    ap.add_argument('--config', default=str(script_dir / 'config.yml'),
+                    help='YAML file with configuration options.')
+    ap.add_argument('-f', '--filename', type=str, nargs='*',
+                    default=['/opt/shibboleth-idp/logs/idp-process.log'],
+                    help='Log filename(s) to keep loaded, accepts wildcards')
+    ap.add_argument('--socket', default=DEFAULT_SOCKET,
+                    help=f'Unix socket to listen on (default: {DEFAULT_SOCKET})')
+    ap.add_argument('-i', '--interval', type=float, default=5,
+                    help='Seconds between checks for changed files (default: 5)')
+    args = ap.parse_args()
+
+    config = args.config
+    if not os.path.exists(config):
+        print(f'No config file {config}; only answering logscan.py')
+        config = None
+    daemon = QueryDaemon(config, args.filename, interval=args.interval)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    print(f'Listening on {args.socket}')
+    try:
+        daemon.serve(args.socket)
+    except KeyboardInterrupt:
+        pass
@@ -1,7 +1,7 @@
 #!/usr/bin/env python3
 
 from argparse import ArgumentParser
-from parsers import ShibbolethLog
+from parsers.client import DEFAULT_SOCKET, query_daemon
 import os
 
 
@@ -9,18 +9,133 @@ def help(args):
     argp.print_help()
 
 
+# Asks the query daemon, if one is running with these log files, and
+# prints its answer. Returns False if the scan still needs to be done.
+def ask_daemon(args):
+    if (args.no_daemon or args.output or args.format or args.stats or args.profile
+            or args.approximate or args.partial or args.merge or args.detect or args.sso
+            or args.keep_overlaps):
+        return False
+    request = {
+        'command': 'logscan',
+        'filename': [os.path.abspath(f) for f in args.filename],
+        'principal': args.principal,
+        'requester': args.requester,
+        'daily': args.daily,
+    }
+    response = query_daemon(args.socket, request)
+    if response is None:
+        return False
+    print(response, end='')
+    return True
+
+
 def scan(args):
+    from parsers import RunStats, ShibbolethLog
+    from parsers.stats import profiled
+
+    stats = RunStats(enabled=bool(args.stats), verbose=args.verbose)
     kwargs = {
         'principal': args.principal,
         'requester': args.requester,
-        # 'sso': args.sso,
+        'sso': args.sso,
+        'session_minutes': args.session_minutes,
         'daily': args.daily,
         'output': args.output,
+        'format': args.format,
+        'compress': args.compress,
+        'partial': args.partial,
+        'approximate': args.approximate,
+        'sketch_in': args.sketch_in,
+        'sketch_out': args.sketch_out,
+        'stats': stats,
+        'decompressor': args.decompressor,
+        'prefetch': not args.no_prefetch,
+        'keep_overlaps': args.keep_overlaps,
     }
     log = ShibbolethLog(**kwargs)
-    for filename in args.filename:
-        log.load(filename)
-    log.command_scan()
+    with profiled(args.profile):
+        log.load_all(args.filename)
+        with stats.phase('count'):
+            log.count_events()
+        if args.partial:
+            log.save_partial(args.partial)
+        else:
+            try:
+                log.output_results()
+            except ValueError as e:
+                # E.g. a --sketch-in file saved with a different K.
+                print(f'ERROR: {e}')
+                exit(1)
+    if args.stats:
+        stats.write(args.stats)
+
+
+# Watches for bursts of failed logins, writing an alert for each IP
+# address or principal over its threshold. With --follow, keeps reading
+# lines as they are appended until interrupted.
+def detect(args):
+    from parsers import RunStats, ShibbolethLog
+    import time
+
+    stats = RunStats(enabled=bool(args.stats), verbose=args.verbose)
+    log = ShibbolethLog(
+        principal=args.principal,
+        requester=None,
+        daily=False,
+        detect=True,
+        window=args.window,
+        ip_threshold=args.ip_threshold,
+        principal_threshold=args.principal_threshold,
+        output=args.output,
+        format=args.format,
+        compress=args.compress,
+        stats=stats,
+        decompressor=args.decompressor,
+        prefetch=not args.no_prefetch,
+        keep_overlaps=args.keep_overlaps)
+    try:
+        if not args.follow:
+            log.load_all(args.filename)
+        else:
+            log.load_all([f for f in args.filename if os.path.exists(f)], follow=True)
+            while True:
+                time.sleep(args.interval)
+                for filename in args.filename:
+                    if os.path.exists(filename):
+                        log.load_new(filename)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        log.close_outputs()
+    if args.stats:
+        stats.write(args.stats)
+
+
+# Combines partial files written by --partial (e.g. on each IdP node)
+# into the same reports a scan of all their logs would produce.
+def merge(args):
+    from parsers.shibboleth import ShibbolethLog, read_partial
+
+    partials = [read_partial(filename) for filename in args.merge]
+    options = partials[0]['options']
+    log = ShibbolethLog(
+        principal=options['principal'],
+        requester=options['requester'],
+        daily=options['daily'],
+        approximate=options['approximate'],
+        output=args.output,
+        format=args.format,
+        compress=args.compress,
+        sketch_in=args.sketch_in,
+        sketch_out=args.sketch_out)
+    try:
+        for partial in partials:
+            log.merge_partial(partial)
+        log.output_results()
+    except ValueError as e:
+        print(f'ERROR: {e}')
+        exit(1)
 
 
 def main(args):
@@ -30,7 +145,12 @@ def main(args):
         if not os.path.exists(output_dir):
             os.mkdir(output_dir)
         args.output = output_dir
-    scan(args)
+    if args.merge:
+        merge(args)
+    elif args.detect:
+        detect(args)
+    elif not ask_daemon(args):
+        scan(args)
 
 
 if __name__ == '__main__':
@@ -53,9 +173,32 @@ if __name__ == '__main__':
     subject.add_argument(
         '-r', '--requester', default=None, nargs='+',
         help='Limit scan to the service provider(s) provided')
-    # subject.add_argument(
-    #     '-s', '--sso', action='store_true',
-    #     help='Determine if SSO was used within above limits')
+    subject.add_argument(
+        '-s', '--sso', action='store_true',
+        help='Report how often SSO reused an existing session, per requester per day, within above limits')
+    subject.add_argument(
+        '--session-minutes', default=60, type=int, metavar='MINUTES',
+        help='With -s, match SSO events to logins no more than this long before them (default: 60)')
+
+    alerts = argp.add_argument_group('Failed login alerts')
+    alerts.add_argument(
+        '--detect', action='store_true',
+        help='Report IP addresses and principals with many failed logins, instead of counting usage')
+    alerts.add_argument(
+        '--window', default=10, type=int, metavar='MINUTES',
+        help='Count failed logins over this many minutes (default: 10)')
+    alerts.add_argument(
+        '--ip-threshold', default=20, type=int, metavar='N',
+        help='Alert when one IP address has this many failures in the window (default: 20)')
+    alerts.add_argument(
+        '--principal-threshold', default=5, type=int, metavar='N',
+        help='Alert when one principal has this many failures in the window (default: 5)')
+    alerts.add_argument(
+        '--follow', action='store_true',
+        help='With --detect, keep reading lines appended to the log files until interrupted')
+    alerts.add_argument(
+        '--interval', default=5, type=float, metavar='SECONDS',
+        help='With --follow, check for new lines this often (default: 5)')
 
     output = argp.add_argument_group('Output options')
     # TODO: -d needs exactly one of -n or -r.
@@ -65,15 +208,60 @@ if __name__ == '__main__':
     output.add_argument(
         '-o', '--output', default=None, nargs='?',
         help='Create logs of results in this output directory')
-    # output.add_argument(
-    #     '-v', '--verbose', action='store_true',
-    #     help='Provide verbose output')
+    output.add_argument(
+        '--format', default=None, choices=['csv', 'tsv', 'jsonl'],
+        help='Output format (default: csv, or plain text for the -n/-r detail view)')
+    output.add_argument(
+        '--compress', default=None, choices=['gzip', 'zstd'],
+        help='Compress the files written with -o (zstd needs the zstandard package)')
+    output.add_argument(
+        '-a', '--approximate', default=None, nargs='?', const=50, type=int, metavar='K',
+        help='Count approximately in memory bounded per requester per day: the top K (default 50) '
+             'requesters and principals, and distinct principals per requester per day')
+    output.add_argument(
+        '--sketch-out', default=None, metavar='FILE',
+        help='With -a, save the sketches as JSON to merge into a later scan')
+    output.add_argument(
+        '--sketch-in', default=[], nargs='+', metavar='FILE',
+        help='With -a, merge sketches saved by --sketch-out into the results')
+    output.add_argument(
+        '-v', '--verbose', action='store_true',
+        help='Report progress for each file on stderr')
+    output.add_argument(
+        '--stats', default=None, metavar='FILE',
+        help='Write timing and line counts as JSON to this file (- for stderr)')
+    output.add_argument(
+        '--profile', default=None, metavar='FILE',
+        help='Write cProfile data for the run to this file')
 
     targets = argp.add_argument_group('Which log files to scan')
     targets.add_argument(
         '-f', '--filename', type=str, nargs='*',
         default=['/opt/shibboleth-idp/logs/idp-process.log'],
         help='Log filename(s) to process, accepts wildcards')
+    targets.add_argument(
+        '--keep-overlaps', action='store_true',
+        help='Scan every file given, even if it is the same as, or a copy of part of, another')
+    targets.add_argument(
+        '--partial', default=None, metavar='FILE',
+        help='Write the counts to this partial file instead of reporting them, to combine later with --merge')
+    targets.add_argument(
+        '--merge', default=None, nargs='+', metavar='FILE',
+        help='Report the combined counts from these partial files instead of scanning logs; '
+             'they must all use the same -n, -r, -d, and -a options, which are taken from them')
+    targets.add_argument(
+        '--socket', default=DEFAULT_SOCKET,
+        help=f'Query daemon socket to try first (default: {DEFAULT_SOCKET})')
+    targets.add_argument(
+        '--no-daemon', action='store_true',
+        help='Don’t try the query daemon; always scan in this process')
+    targets.add_argument(
+        '--decompressor', default='auto',
+        choices=['auto', 'python', 'igzip', 'pigz'],
+        help='How to decompress .gz files (default: igzip or pigz if installed)')
+    targets.add_argument(
+        '--no-prefetch', action='store_true',
+        help='Read files in the same thread that parses them')
 
     args = argp.parse_args()
     if args.daily:
@@ -81,5 +269,49 @@ if __name__ == '__main__':
             or (not args.principal and not args.requester)):
             print('The -d/--daily option requires exactly one of -n/--principal or -r/--requester')
             exit(1)
+    if args.merge and (args.partial or args.principal or args.requester or args.daily
+                       or args.approximate is not None):
+        print('The --merge option takes -n, -r, -d, and -a from the partial files, and can’t be used with --partial')
+        exit(1)
+    if args.compress and not args.output:
+        print('The --compress option requires -o/--output')
+        exit(1)
+    if args.approximate is not None:
+        if args.daily or (args.principal and args.requester):
+            print('The -a/--approximate option can’t be used with -d/--daily or with both -n and -r')
+            exit(1)
+        if args.approximate < 1:
+            print('The -a/--approximate option needs a K of at least 1')
+            exit(1)
+    elif (args.sketch_in or args.sketch_out) and not args.merge:
+        print('The --sketch-in and --sketch-out options require -a/--approximate')
+        exit(1)
+
+    if args.detect:
+        if (args.requester or args.daily or args.approximate is not None or args.partial
+                or args.merge):
+            print('The --detect option can’t be used with -r, -d, -a, --partial, or --merge')
+            exit(1)
+        if args.window < 1 or args.ip_threshold < 1 or args.principal_threshold < 1:
+            print('The --window and threshold options must be at least 1')
+            exit(1)
+    elif args.follow:
+        print('The --follow option requires --detect')
+        exit(1)
+
+    if args.sso:
+        if (args.daily or args.approximate is not None or args.partial or args.merge
+                or args.detect):
+            print('The -s/--sso option can’t be used with -d, -a, --partial, --merge, or --detect')
+            exit(1)
+        if args.session_minutes < 1:
+            print('The --session-minutes option must be at least 1')
+            exit(1)
+
+    if args.decompressor not in ['auto', 'python']:
+        import shutil
+        if not shutil.which(args.decompressor):
+            print(f'The --decompressor {args.decompressor} is not installed')
+            exit(1)
 
     main(args)
@@ -1,9 +1,41 @@
 #!/usr/bin/env python3
 
-from .attribute_filter import AttributeFilterConfig
-from .attribute_resolver import AttributeResolverConfig
-from .metadata import MetadataConfig
-from .metadata_resolver import MetadataResolverConfig
-from .services import ServicesConfig
-from .shibboleth import ShibbolethLog
-from .webserver import WebserverLog
+# Classes are imported from their submodules the first time they are
+# used, so a script only pays for the modules (and dependencies such as
+# cryptography and PyYAML) that it actually needs.
+
+import importlib
+
+_SUBMODULES = {
+    'AttributeFilterConfig': 'attribute_filter',
+    'AttributeResolverConfig': 'attribute_resolver',
+    'FailureDetector': 'detector',
+    'HyperLogLog': 'sketches',
+    'IdPConfig': 'config',
+    'MetadataConfig': 'metadata',
+    'MetadataRefreshChecker': 'refresh',
+    'MetadataResolverConfig': 'metadata_resolver',
+    'QueryDaemon': 'daemon',
+    'RunStats': 'stats',
+    'ServicesConfig': 'services',
+    'SessionTracker': 'sessions',
+    'ShibbolethLog': 'shibboleth',
+    'SpaceSaving': 'sketches',
+    'UsageSketch': 'sketches',
+    'WebserverLog': 'webserver',
+}
+
+__all__ = sorted(_SUBMODULES)
+
+
+def __getattr__(name):
+    if name not in _SUBMODULES:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+    module = importlib.import_module(f'.{_SUBMODULES[name]}', __name__)
+    value = getattr(module, name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -1,7 +1,8 @@
 #!/usr/bin/env python3
 
 import re
-import xml.etree.ElementTree as ET
+from ._xmlbackend import get_backend
+from .stats import RunStats
 
 
 class _ConfigFile(object):
@@ -27,17 +28,32 @@ class _ConfigFile(object):
         'xsi': 'http://www.w3.org/2001/XMLSchema-instance',
     }
 
-    def __init__(self, config, filenames):
+    # Cache of Clark-notation tags and attribute names returned by
+    # `xmlns()`, keyed by (prefix, name). Each subclass gets its own
+    # when it is created, since it may override XMLNS.
+    TAGS = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.TAGS = {}
+
+    def __init__(self, config, filenames, stats=None):
         self.config = config
+        self.stats = stats if stats is not None else RunStats(enabled=False)
+        self.xml = get_backend(config)
         self.translate_config()
         self.stanzas = {}
-        for filename in filenames:
-            self.load_stanzas(filename)
+        with self.stats.phase(f'load {type(self).__name__}'):
+            for filename in filenames:
+                self.load_stanzas(filename)
+                self.stats.file(filename, type=type(self).__name__)
 
     def load_stanzas(self, filename):
-        tree = ET.parse(filename)
-        root = tree.getroot()
+        with self.stats.phase('xml parse'):
+            root = self.xml.parse(filename)
         for child in root:
+            if not isinstance(child.tag, str):
+                continue
             id = child.attrib.get('id')
             if id in self.stanzas:
                 raise ValueError(f'Duplicate id {id} in {filename}')
@@ -70,4 +86,8 @@ class _ConfigFile(object):
 
     # Returns a string suitable for matching namespaced tags or attribs.
     def xmlns(self, ns, item):
-        return '{' + self.XMLNS[ns] + '}' + item
+        try:
+            return self.TAGS[ns, item]
+        except KeyError:
+            tag = self.TAGS[ns, item] = '{' + self.XMLNS[ns] + '}' + item
+            return tag
@@ -1,8 +1,13 @@
 #!/usr/bin/env python3
 
-import gzip
+import os
 import re
+import time
 from datetime import timedelta
+from itertools import islice
+from ._overlap import _Coverage
+from ._reader import _LineReader
+from .stats import RunStats
 
 
 class _LogEvent(object):
@@ -40,11 +45,35 @@ class _LogFile(object):
     LINE_REGEX = r'^(.*)$'
     SEQUENCE_CLASS = _LogSequence
 
+    # Compiled patterns for every `*_REGEX` class variable, keyed by its
+    # name. Rebuilt for each subclass when it is created, so a subclass
+    # only has to override the pattern string.
+    PATTERNS = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.compile_patterns()
+
+    @classmethod
+    def compile_patterns(cls):
+        cls.PATTERNS = {}
+        for name in dir(cls):
+            pattern = getattr(cls, name)
+            if name.endswith('_REGEX') and isinstance(pattern, str):
+                cls.PATTERNS[name] = re.compile(pattern)
+
     def __init__(self, filename='', **kwargs):
         self.events = []
         self.sequences = {}
+        self.stats = RunStats(enabled=False)
+        self.decompressor = 'auto'
+        self.prefetch = True
+        self.keep_overlaps = False
+        self.positions = {}
+        # The file whose lines are being parsed.
+        self.loading = None
         for key, value in kwargs.items():
-            if key in ['events', 'sequences']:
+            if key in ['events', 'positions', 'sequences']:
                 raise ValueError
             setattr(self, key, value)
         if filename:
@@ -60,32 +89,154 @@ class _LogFile(object):
                 self.sequences[index].append(self.SEQUENCE_CLASS())
             self.sequences[index][-1].append(event)
 
+    # Returns the number of lines read and the number of events kept.
+    # Lines dropped for a regex miss or by `validate_line()` are counted
+    # here; `make_event()` should call `self.stats.drop()` with a reason
+    # whenever it returns None.
     def import_log(self, logfile):
+        lines = kept = skipped = regex_miss = invalid = 0
+        prefilter = self.make_prefilter()
+        match = self.PATTERNS['LINE_REGEX'].match
+        add_event = self.add_event
         for logline in logfile:
+            lines += 1
             if isinstance(logline, bytes):
                 logline = logline.decode()
-            parse = re.match(self.LINE_REGEX, logline)
+            if prefilter is not None and not prefilter(logline):
+                skipped += 1
+                continue
+            parse = match(logline)
             if parse is None:
+                regex_miss += 1
                 continue
             if not self.validate_line(parse):
+                invalid += 1
                 continue
             event = self.make_event(parse)
             if event:
-                self.events.append(event)
+                kept += 1
+                add_event(event)
+        self.stats.add('lines_read', lines)
+        self.stats.add('lines_matched', lines - skipped - regex_miss)
+        self.stats.add('events_kept', kept)
+        self.stats.dropped['prefilter'] += skipped
+        self.stats.dropped['regex_miss'] += regex_miss
+        self.stats.dropped['validate_line'] += invalid
+        return lines, kept
 
     def load(self, filename):
+        self.load_all([filename])
+
+    # Loads the files in order. With `self.prefetch`, reading and
+    # decompression run in a background thread, which gets on with the
+    # next file while this one is still being parsed. Unless
+    # `self.keep_overlaps`, files that repeat lines of others are skipped
+    # or trimmed (see `_Coverage`).
+    #
+    # With `follow`, where each file was read up to is saved, including
+    # files that were skipped, so that `load_new()` afterwards only reads
+    # lines appended since.
+    def load_all(self, filenames, follow=False):
+        stats = {filename: os.stat(filename) for filename in filenames} if follow else {}
+        coverage = None
+        if len(filenames) > 1 and not self.keep_overlaps:
+            with self.stats.phase('overlap'):
+                coverage = _Coverage(filenames, self.line_time, self.stats)
+            filenames = coverage.filenames
+        offsets = {filename: 0 for filename in filenames} if follow else None
+        reader = _LineReader(filenames, self.decompressor, self.prefetch, self.stats, offsets)
+        self.load_reader(reader, coverage)
+        for filename, stat in stats.items():
+            offset = stat.st_size
+            if not filename.endswith('.gz') and filename in offsets:
+                offset = offsets[filename]
+            self.positions[filename] = (stat.st_ino, offset)
+
+    # Loads whatever has been added to the file since the last call, for
+    # following a live log. If the file has been replaced (e.g. rotated)
+    # or truncated, `forget()` is called and it is read again from the
+    # start. Compressed files are only read again (in full) if they
+    # change. Returns True if any lines were read.
+    def load_new(self, filename):
+        stat = os.stat(filename)
+        inode, offset = self.positions.get(filename, (None, 0))
+        if stat.st_size == offset and inode == stat.st_ino:
+            return False
+        if inode != stat.st_ino or stat.st_size < offset or filename.endswith('.gz'):
+            offset = 0
+            if filename in self.positions:
+                self.forget(filename)
+        offsets = {filename: offset}
+        reader = _LineReader([filename], self.decompressor, False, self.stats, offsets)
+        self.load_reader(reader)
         if filename.endswith('.gz'):
-            logfile = gzip.open(filename)
-        else:
-            logfile = open(filename)
-        self.import_log(logfile)
+            offsets[filename] = stat.st_size
+        self.positions[filename] = (stat.st_ino, offsets[filename])
+        return offsets[filename] != offset
+
+    def load_reader(self, reader, coverage=None):
+        for filename, logfile in reader:
+            self.loading = filename
+            start = time.perf_counter()
+            trim = {}
+            covered = coverage.covered_lines(filename) if coverage else 0
+            dropped = self.stats.dropped['overlap']
+            if covered:
+                logfile = self.trim_lines(logfile, covered)
+            with self.stats.phase('parse'):
+                lines, kept = self.import_log(logfile)
+            trimmed = self.stats.dropped['overlap'] - dropped
+            if coverage:
+                coverage.done(filename, trimmed + lines)
+            if covered:
+                trim = {'trimmed': trimmed}
+            size = reader.sizes.pop(filename, 0)
+            seconds = time.perf_counter() - start
+            self.stats.add('bytes_read', size)
+            self.stats.file(filename, bytes=size, lines=lines, events=kept, seconds=seconds, **trim)
+            self.stats.progress(f'{filename}: {lines} lines, {kept} events in {seconds:.1f}s')
+
+    # Yields the lines after the first `count`, which repeat lines of a
+    # file already loaded.
+    def trim_lines(self, lines, count):
+        lines = iter(lines)
+        trimmed = sum(1 for line in islice(lines, count))
+        self.stats.add('lines_read', trimmed)
+        self.stats.dropped['overlap'] += trimmed
+        yield from lines
+
+    # Override this in a subclass to return the time of a raw line, as
+    # something that sorts in time order, or None if it has none. Files
+    # whose lines have no times are only skipped as exact copies, though
+    # lines they repeat are still trimmed.
+    def line_time(self, line):
+        return None
+
+    # Override this in a subclass to drop what was loaded from `filename`,
+    # which is about to be read again from the start.
+    def forget(self, filename):
+        pass
+
+    # Override this in a subclass to handle events as they are parsed,
+    # instead of keeping them all in `self.events`.
+    def add_event(self, event):
+        self.events.append(event)
 
     # Override this in a subclass
     # Original line available as parse.string
     def make_event(self, parse):
         return None
 
+    # Override this in a subclass to return a function that takes a raw
+    # line and returns False if it can’t possibly produce an event, so it
+    # can be skipped before the full regex parse. None means no prefilter.
+    def make_prefilter(self):
+        return None
+
     # Override this in a subclass
     # Original line available as parse.string
     def validate_line(self, parse):
         return True
+
+
+_LogFile.compile_patterns()
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+
+import gzip
+import os
+
+# Bytes read from the start of each file to recognize copies, and from
+# the end of uncompressed files to find their last timestamp.
+HEAD_BYTES = 4096
+TAIL_BYTES = 1 << 16
+
+# Why a file was skipped, as recorded in the stats and in words.
+REASONS = {
+    'same_file': 'the same file as',
+    'copy': 'a copy of',
+    'covered': 'covered by',
+}
+
+
+class _FileProbe(object):
+    """
+    What can be learned about a log file without reading all of it: its
+    identity on disk, the first few KiB of its contents (decompressed),
+    its first timestamp, and, unless it is compressed, its last one and
+    its size. For `.gz` files, `size` is the uncompressed size modulo
+    2**32 from the gzip trailer, and `last` is None.
+    """
+
+    def __init__(self, filename, line_time):
+        self.filename = filename
+        stat = os.stat(filename)
+        self.identity = (stat.st_dev, stat.st_ino)
+        self.last = None
+        if filename.endswith('.gz'):
+            with gzip.open(filename, 'rb') as f:
+                self.head = f.read(HEAD_BYTES)
+            with open(filename, 'rb') as f:
+                if stat.st_size >= 4:
+                    f.seek(-4, os.SEEK_END)
+                    self.size = int.from_bytes(f.read(4), 'little')
+                else:
+                    self.size = 0
+            self.compressed = True
+        else:
+            with open(filename, 'rb') as f:
+                self.head = f.read(HEAD_BYTES)
+                f.seek(max(0, stat.st_size - TAIL_BYTES))
+                tail = f.read().split(b'\n')
+            if stat.st_size > TAIL_BYTES:
+                # The first line is probably incomplete.
+                tail = tail[1:]
+            self.last = find_time(reversed(tail), line_time)
+            self.size = stat.st_size
+            self.compressed = False
+        self.first = find_time(self.head.split(b'\n'), line_time)
+
+    # Whether this and `other` start the same way, so one is a copy of
+    # (part of) the other, rather than a log from another day or node.
+    def same_stream(self, other):
+        if b'\n' not in self.head or b'\n' not in other.head:
+            return False
+        return self.head.startswith(other.head) or other.head.startswith(self.head)
+
+    # Whether this is an exact copy of `other`, possibly compressed
+    # differently.
+    def same_contents(self, other):
+        if not self.same_stream(other) or self.first != other.first:
+            return False
+        if self.compressed or other.compressed:
+            sizes = (self.size % (1 << 32), other.size % (1 << 32))
+        else:
+            sizes = (self.size, other.size)
+        if sizes[0] != sizes[1]:
+            return False
+        return self.last is None or other.last is None or self.last == other.last
+
+
+# Returns the first timestamp `line_time()` finds in the lines.
+def find_time(lines, line_time):
+    for line in lines:
+        if isinstance(line, bytes):
+            line = line.decode('utf-8', errors='replace')
+        time = line_time(line)
+        if time is not None:
+            return time
+    return None
+
+
+class _Coverage(object):
+    """
+    Decides which of a list of log files repeat lines from others, so a
+    glob that matches a log, a copy of it, and its `.gz` doesn’t count
+    the same logins twice.
+
+    Before anything is read, `filenames` are probed: a file that is the
+    same file on disk as one before it (through a link, or because two
+    globs matched it) or an exact copy of one is skipped, as is one that
+    starts the same way as an earlier file and is no longer and ends no
+    later. Each skip is recorded in `stats` with its reason.
+
+    The rest are loaded in order. A file that starts the same way as one
+    already loaded but goes on past it has as many leading lines as were
+    loaded from that file trimmed as it is read (`covered_lines()`), so
+    distinct events at the boundary that share a timestamp are kept.
+    Logs that merely overlap in time, such as those from different nodes
+    of a cluster, start differently and are left alone.
+    """
+
+    def __init__(self, filenames, line_time, stats):
+        self.probes = {}
+        self.filenames = []
+        # Numbers of lines loaded, as (probe, lines).
+        self.loaded = []
+        kept = []
+        for filename in filenames:
+            probe = _FileProbe(filename, line_time)
+            skip = self.check(probe, kept)
+            if skip:
+                reason, other = skip
+                stats.skip_file(filename, reason, like=other.filename)
+                stats.progress(f'{filename}: skipped, {REASONS[reason]} {other.filename}')
+                continue
+            kept.append(probe)
+            self.probes[filename] = probe
+            self.filenames.append(filename)
+
+    # Returns (reason, other probe) if `probe` can be skipped.
+    def check(self, probe, kept):
+        for other in kept:
+            if probe.identity == other.identity:
+                return 'same_file', other
+            if probe.same_contents(other):
+                return 'copy', other
+            if (probe.same_stream(other) and probe.last is not None
+                    and other.last is not None and probe.last <= other.last
+                    and probe.size <= other.size):
+                return 'covered', other
+        return None
+
+    # Returns the number of leading lines of `filename` that repeat those
+    # of files already loaded, or 0 if none do.
+    def covered_lines(self, filename):
+        probe = self.probes[filename]
+        return max((lines for other, lines in self.loaded if probe.same_stream(other)), default=0)
+
+    # Records the number of lines in a file that has been loaded.
+    def done(self, filename, lines):
+        self.loaded.append((self.probes[filename], lines))
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+
+from queue import Full, Queue
+import gzip
+import os
+import shutil
+import subprocess
+import threading
+import time
+
+
+class _LineReader(object):
+    """
+    Reads one or more log files as batches of decoded lines.
+
+    With `prefetch`, reading, decompression, and decoding happen in a
+    background thread that fills a bounded queue, and it moves straight
+    on to the next file while the parser is still working through the
+    current one. zlib and the decompressor subprocesses release the GIL,
+    so this overlaps with parsing; the queue bounds memory use.
+
+    Iterating yields `(filename, lines)` pairs, where `lines` must be
+    consumed completely before asking for the next file.
+
+    If `offsets` is a dict, uncompressed files are read starting from the
+    byte offset it gives for their filename, an incomplete last line is
+    left for next time, and the dict is updated with the offset to resume
+    from. Compressed files are always read in full, an incomplete
+    last line included.
+
+    The number of bytes read from each file on disk (from the offset, if
+    any) is added up in `sizes`, keyed by filename.
+    """
+
+    # Bytes to read at a time, and batches to buffer ahead of the parser.
+    BATCH_BYTES = 1 << 20
+    QUEUE_SIZE = 16
+
+    # Decompressors to try, in order, for `decompressor='auto'`.
+    EXTERNAL = ['igzip', 'pigz']
+
+    def __init__(self, filenames, decompressor='auto', prefetch=True, stats=None, offsets=None):
+        self.filenames = list(filenames)
+        self.offsets = offsets
+        self.decompressor = self.choose_decompressor(decompressor)
+        self.prefetch = prefetch
+        self.stats = stats
+        self.queue = Queue(maxsize=self.QUEUE_SIZE)
+        self.stop = threading.Event()
+        self.sizes = {}
+
+    def __iter__(self):
+        if not self.prefetch:
+            for filename in self.filenames:
+                yield filename, self.read_lines(filename)
+            return
+        thread = threading.Thread(target=self.produce, daemon=True)
+        thread.start()
+        try:
+            while True:
+                item = self.get()
+                if item is None:
+                    break
+                kind, filename = item[:2]
+                if kind == 'error':
+                    raise item[2]
+                yield filename, self.consume()
+        finally:
+            self.stop.set()
+
+    # Returns the name of an installed decompressor, or 'python'.
+    def choose_decompressor(self, name):
+        if name == 'auto':
+            for tool in self.EXTERNAL:
+                if shutil.which(tool):
+                    return tool
+            return 'python'
+        if name != 'python' and not shutil.which(name):
+            raise ValueError(f'Decompressor {name} is not installed')
+        return name
+
+    # Yields the batches queued for the current file, until its end marker.
+    def consume(self):
+        while True:
+            item = self.get()
+            kind = item[0]
+            if kind == 'error':
+                raise item[2]
+            if kind == 'end':
+                return
+            yield from item[1]
+
+    def get(self):
+        if self.stats is None:
+            return self.queue.get()
+        with self.stats.phase('parse wait'):
+            return self.queue.get()
+
+    # Yields batches (lists of lines) from the file, decompressing it if
+    # its name ends in `.gz`. Lines are split on newlines only, and keep
+    # no line ending (`\r\n` as well as `\n`).
+    def read_batches(self, filename):
+        process = None
+        offset = 0
+        compressed = filename.endswith('.gz')
+        if not compressed:
+            f = open(filename, 'rb')
+            if self.offsets is not None:
+                offset = self.offsets.get(filename, 0)
+                f.seek(offset)
+        elif self.decompressor == 'python':
+            f = gzip.open(filename, 'rb')
+        else:
+            command = [self.decompressor, '-dc', filename]
+            process = subprocess.Popen(command, stdout=subprocess.PIPE)
+            f = process.stdout
+        size = 0
+        try:
+            pending = b''
+            while True:
+                start = time.perf_counter()
+                cpu = time.thread_time()
+                block = f.read(self.BATCH_BYTES)
+                if not block:
+                    break
+                size += len(block)
+                block = pending + block
+                cut = block.rfind(b'\n') + 1
+                pending = block[cut:]
+                offset += cut
+                if cut:
+                    text = block[:cut].decode('utf-8', errors='replace')
+                    if '\r' in text:
+                        text = text.replace('\r\n', '\n')
+                    batch = text[:-1].split('\n')
+                    self.record('read', start, cpu, len(batch))
+                    yield batch
+            if pending and (self.offsets is None or compressed):
+                yield [pending.decode('utf-8', errors='replace').rstrip('\r')]
+            if self.offsets is not None:
+                self.offsets[filename] = offset
+        finally:
+            f.close()
+            if process is not None:
+                if process.wait() and not self.stop.is_set():
+                    raise RuntimeError(f'{self.decompressor} failed on {filename}')
+            on_disk = os.path.getsize(filename) if compressed else size
+            self.sizes[filename] = self.sizes.get(filename, 0) + on_disk
+            if self.stats is not None:
+                self.stats.add('bytes_decompressed', size)
+
+    def read_lines(self, filename):
+        for batch in self.read_batches(filename):
+            yield from batch
+
+    # Runs in the background thread: queues every file’s batches in turn.
+    def produce(self):
+        try:
+            for filename in self.filenames:
+                if not self.put(('start', filename)):
+                    return
+                for batch in self.read_batches(filename):
+                    if not self.put(('batch', batch)):
+                        return
+                if not self.put(('end', filename)):
+                    return
+            self.put(None)
+        except Exception as e:
+            self.put(('error', None, e))
+
+    # Queues an item, giving up if the consumer has gone away.
+    def put(self, item):
+        while not self.stop.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return True
+            except Full:
+                continue
+        return False
+
+    # Records time spent reading, with the CPU time of the thread doing it.
+    def record(self, stage, start, cpu, lines):
+        if self.stats is None or not self.stats.enabled:
+            return
+        phase = self.stats.phases.setdefault(stage, {'wall': 0.0, 'cpu': 0.0, 'calls': 0, 'lines': 0})
+        phase['wall'] += time.perf_counter() - start
+        phase['cpu'] += time.thread_time() - cpu
+        phase['calls'] += 1
+        phase['lines'] += lines
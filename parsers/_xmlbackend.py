@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+
+# The XML parser behind the config file classes: lxml if it is installed,
+# otherwise the standard library’s ElementTree. Both give elements with
+# the same `tag`, `attrib`, `text`, iteration, and `findall()`, so the
+# classes don’t need to know which they have.
+#
+# With lxml, one libxml2 parse both checks that a file is well-formed
+# (instead of running xmllint on it) and builds its tree: `validate()`
+# keeps the tree, and the next `parse()` of that file takes it.
+
+import os
+import xml.etree.ElementTree as ET
+
+
+class ElementTreeBackend(object):
+    name = 'etree'
+    ParseError = ET.ParseError
+    # Whether `validate()` can replace xmllint.
+    validates = False
+
+    def __init__(self):
+        self.paths = {}
+
+    def parse(self, filename):
+        return ET.parse(filename).getroot()
+
+    # Returns a function that finds the elements matching `path` (such
+    # as './/ds:X509Certificate') under an element it is given.
+    def compile_path(self, path, namespaces):
+        key = (path, tuple(sorted(namespaces.items())))
+        if key not in self.paths:
+            self.paths[key] = self.make_path(path, namespaces)
+        return self.paths[key]
+
+    def make_path(self, path, namespaces):
+        return lambda element: element.findall(path, namespaces)
+
+    # Drops any trees kept by `validate()` that haven’t been parsed.
+    def release(self):
+        pass
+
+    # Returns an incremental parser to `feed()` bytes to, for documents
+    # too large to hold, with `read_events()` and `close()`.
+    def pull_parser(self, events=('end',)):
+        return ET.XMLPullParser(events=events)
+
+
+class LxmlBackend(ElementTreeBackend):
+    name = 'lxml'
+    validates = True
+
+    def __init__(self, huge_tree=False):
+        super().__init__()
+        from lxml import etree
+
+        self.etree = etree
+        self.ParseError = etree.XMLSyntaxError
+        # Comments and processing instructions would show up as children
+        # (unlike with ElementTree), so leave them out.
+        self.options = {'huge_tree': huge_tree, 'remove_comments': True, 'remove_pis': True}
+        self.parser = etree.XMLParser(**self.options)
+        # {filename: (mtime, size, root)} for files validated but not yet parsed.
+        self.validated = {}
+
+    # Parses `filename`, raising ParseError if it isn’t well-formed, and
+    # keeps the tree for the next `parse()`.
+    def validate(self, filename):
+        filename = str(filename)
+        stat = os.stat(filename)
+        root = self.etree.parse(filename, self.parser).getroot()
+        self.validated[filename] = (stat.st_mtime_ns, stat.st_size, root)
+
+    def parse(self, filename):
+        filename = str(filename)
+        cached = self.validated.pop(filename, None)
+        if cached is not None:
+            stat = os.stat(filename)
+            if cached[:2] == (stat.st_mtime_ns, stat.st_size):
+                return cached[2]
+        return self.etree.parse(filename, self.parser).getroot()
+
+    def release(self):
+        self.validated.clear()
+
+    def make_path(self, path, namespaces):
+        return self.etree.XPath(path, namespaces=namespaces)
+
+    def pull_parser(self, events=('end',)):
+        return self.etree.XMLPullParser(events=events, **self.options)
+
+
+_BACKENDS = {}
+
+
+# Returns the backend named by `config['xml-backend']`: 'lxml', 'etree',
+# or 'auto' (the default) for lxml if it is installed. Backends are
+# shared, so trees kept by `validate()` are there for any config file
+# class to use.
+def get_backend(config):
+    name = config.get('xml-backend', 'auto')
+    huge_tree = bool(config.get('xml-huge-tree', False))
+    key = (name, huge_tree)
+    if key not in _BACKENDS:
+        if name == 'etree':
+            _BACKENDS[key] = ElementTreeBackend()
+        elif name in ['lxml', 'auto']:
+            try:
+                _BACKENDS[key] = LxmlBackend(huge_tree)
+            except ImportError:
+                if name == 'lxml':
+                    raise RuntimeError('The lxml XML backend needs the lxml package') from None
+                _BACKENDS[key] = ElementTreeBackend()
+        else:
+            raise ValueError(f'Unknown XML backend {name}')
+    return _BACKENDS[key]
@@ -1,40 +1,191 @@
 #!/usr/bin/env python3
 
 from ._configfile import _ConfigFile
+from . import filter_rules as rules
+import re
 
 
 class AttributeFilterConfig(_ConfigFile):
     """
     This is a representation of `conf/attribute-filter.xml`, in order
-    to identify which attributes are being released.
+    to identify which attributes are being released, and to which
+    requesters.
     """
     # Inherited variables:
     #     PATH_SUB = re.compile(...)
+    #     TAGS = {...}
     #     XMLNS = {...}
     # Inherited methods:
-    #     __init__(self, config, filenames)
+    #     __init__(self, config, filenames, stats=None)
     #     load_stanzas(self, filename)
     #     make_path(self, text)
     #     translate_config(self)
     #     xmlns(self, ns, item)
 
+    # Rule types from the older `basic:` and `saml:` namespaces, and the
+    # names they were given in IdP v3.
+    LEGACY_RULES = {
+        'AttributeRequesterString': 'Requester',
+        'AttributeRequesterRegex': 'RequesterRegex',
+        'AttributeRequesterInEntityGroup': 'InEntityGroup',
+        'AttributeScopeString': 'Scope',
+        'AttributeScopeRegex': 'ScopeRegex',
+        'AttributeValueString': 'Value',
+        'AttributeValueRegex': 'ValueRegex',
+        'PrincipalNameString': 'Principal',
+        'PrincipalNameRegex': 'PrincipalRegex',
+    }
+
+    # Policy index built by `applicable()`: {key: [policy id]} for the
+    # keys from `index_keys()`, the ids of policies indexed by group, the
+    # ids of policies that must be checked for every requester, and
+    # {policy id: position} to keep results in the order of the files.
+    index = None
+    group_policies = None
+    scan_policies = None
+    order = None
+
+    # Returns [(policy id, True or None)] for the policies whose
+    # requirement rules match (or might match) the request, in the order
+    # they were defined. Only policies that could apply are evaluated.
+    def applicable(self, context):
+        if self.index is None:
+            self.build_index()
+        ids = set(self.scan_policies)
+        ids.update(self.index.get(('requester', context.requester.lower()), ()))
+        if context.groups is None:
+            ids.update(self.group_policies)
+        else:
+            for group in context.groups:
+                ids.update(self.index.get(('group', group), ()))
+        policies = []
+        for id in sorted(ids, key=self.order.get):
+            result = self.stanzas[id]['requirement'].reduce(context)
+            if result is True or result is None:
+                policies.append((id, result))
+        return policies
+
+    def build_index(self):
+        self.index = {}
+        self.group_policies = set()
+        self.scan_policies = []
+        self.order = {}
+        for id, stanza in self.stanzas.items():
+            self.order[id] = len(self.order)
+            keys = stanza['requirement'].index_keys()
+            if keys is None:
+                self.scan_policies.append(id)
+                continue
+            for key in keys:
+                self.index.setdefault(key, []).append(id)
+                if key[0] == 'group':
+                    self.group_policies.add(id)
+
     # Inverts stanza => attribute list mapping for queries.
     def get_released(self):
         release = {}
-        for id, attrs in self.stanzas.items():
-            for attr in attrs:
+        for id, stanza in self.stanzas.items():
+            for attr in stanza['attributes']:
                 if attr not in release:
                     release[attr] = []
                 release[attr].append(id)
         return release
 
-    # Returns a list of the attributes in <AttributeFilterPolicy> elements.
+    # Returns a dict of the requirement rule and {attributeID: {'permit':
+    # rule, 'deny': rule}} in <AttributeFilterPolicy> elements. Missing
+    # permit or deny rules are None.
     def parse_stanza(self, stanza):
         if stanza.tag != self.xmlns('afp', 'AttributeFilterPolicy'):
-            return []
-        values = []
-        for value in stanza:
-            if value.tag != self.xmlns('afp', 'AttributeRule'):
-                continue
-            values.append(value.attrib.get('attributeID'))
-        return values
+            return None
+        requirement = None
+        attributes = {}
+        for child in stanza:
+            if child.tag == self.xmlns('afp', 'PolicyRequirementRule'):
+                requirement = self.parse_rule(child)
+            elif child.tag == self.xmlns('afp', 'AttributeRule'):
+                attr = child.attrib.get('attributeID')
+                permit = deny = None
+                if child.attrib.get('permitAny') == 'true':
+                    permit = rules.Any()
+                for value_rule in child:
+                    if value_rule.tag == self.xmlns('afp', 'PermitValueRule'):
+                        permit = self.parse_rule(value_rule)
+                    elif value_rule.tag == self.xmlns('afp', 'DenyValueRule'):
+                        deny = self.parse_rule(value_rule)
+                if attr in attributes:
+                    # Several rules for one attribute: any may permit or deny.
+                    permit = self.combine_rules(attributes[attr]['permit'], permit)
+                    deny = self.combine_rules(attributes[attr]['deny'], deny)
+                attributes[attr] = {'permit': permit, 'deny': deny}
+        if requirement is None:
+            # e.g. a reference to a rule defined elsewhere.
+            requirement = rules.Unsupported('PolicyRequirementRule')
+        return {
+            'requirement': requirement,
+            'attributes': attributes,
+        }
+
+    def combine_rules(self, first, second):
+        if first is None or second is None:
+            return first or second
+        return rules.Or([first, second])
+
+    # Compiles a rule element (and any rules nested in it) by its xsi:type.
+    def parse_rule(self, element):
+        name = element.attrib.get(self.xmlns('xsi', 'type'), '').rpartition(':')[2]
+        name = self.LEGACY_RULES.get(name, name)
+        attrib = element.attrib
+        case_sensitive = (attrib.get('caseSensitive', 'true') == 'true'
+                          and attrib.get('ignoreCase', 'false') != 'true')
+        children = [self.parse_rule(c) for c in element
+                    if isinstance(c.tag, str) and c.tag.rpartition('}')[2] == 'Rule']
+        if name == 'ANY':
+            return rules.Any()
+        if name == 'AND':
+            return rules.And(children)
+        if name == 'OR':
+            return rules.Or(children)
+        if name == 'NOT':
+            if len(children) != 1:
+                raise ValueError('NOT rule needs exactly one Rule')
+            return rules.Not(children[0])
+        if name in ['Requester', 'Principal', 'Value', 'Scope'] and 'attributeID' not in attrib:
+            return getattr(rules, name)(attrib['value'], case_sensitive)
+        if name in ['RequesterRegex', 'PrincipalRegex', 'ValueRegex', 'ScopeRegex'] and 'attributeID' not in attrib:
+            try:
+                return getattr(rules, name)(attrib['regex'], case_sensitive)
+            except re.error:
+                # Java regex syntax Python doesn’t have, such as \p{Alpha}.
+                return rules.Unsupported(name)
+        if name == 'InEntityGroup':
+            return rules.InEntityGroup(attrib['groupID'])
+        return rules.Unsupported(name)
+
+    # Returns ([(policy id, True or None)], {attributeID: result}) for a
+    # request, where each result is True (all values are released), None
+    # (it can’t be known offline), or a value rule that released values
+    # match. Attributes that can’t be released are left out.
+    def simulate(self, requester, principal=None, groups=None):
+        context = rules.RequestContext(requester, principal, groups)
+        policies = self.applicable(context)
+        permits = {}
+        denies = {}
+        for id, applies in policies:
+            for attr, rule in self.stanzas[id]['attributes'].items():
+                for found, value_rule in [(permits, rule['permit']), (denies, rule['deny'])]:
+                    if value_rule is None:
+                        continue
+                    result = value_rule.reduce(context)
+                    if applies is None:
+                        result = rules.conjoin([None, result])
+                    found.setdefault(attr, []).append(result)
+        released = {}
+        for attr, results in permits.items():
+            # Deny rules win over permit rules.
+            result = rules.conjoin([
+                rules.disjoin(results),
+                rules.negate(rules.disjoin(denies.get(attr, []))),
+            ])
+            if result is not False:
+                released[attr] = result
+        return policies, released
@@ -6,21 +6,62 @@ from ._configfile import _ConfigFile
 class AttributeResolverConfig(_ConfigFile):
     """
     This is a representation of `conf/attribute-resolver.xml`, in order
-    to identify which attributes are available for release.
+    to identify which attributes are available for release, and what
+    each of them depends on.
     """
     # Inherited variables:
     #     PATH_SUB = re.compile(...)
+    #     TAGS = {...}
     #     XMLNS = {...}
     # Inherited methods:
-    #     __init__(self, config, filenames)
+    #     __init__(self, config, filenames, stats=None)
     #     load_stanzas(self, filename)
     #     make_path(self, text)
     #     translate_config(self)
     #     xmlns(self, ns, item)
 
-    # The attribute name from an <AttributeDefinition> element is its id;
-    # this returns a string containing its type, or None for other elements.
+    # Dependency graph, once built by `graph()`.
+    resolver_graph = None
+
+    # Returns the ids of the <AttributeDefinition> elements.
+    def attributes(self):
+        return [id for id, stanza in self.stanzas.items() if stanza['kind'] == 'AttributeDefinition']
+
+    # Returns the ResolverGraph for these files, building it the first time.
+    def graph(self):
+        if self.resolver_graph is None:
+            from .resolver_graph import ResolverGraph
+
+            with self.stats.phase('resolver graph'):
+                self.resolver_graph = ResolverGraph(self.stanzas)
+        return self.resolver_graph
+
+    # Returns a dict with the kind of element (`AttributeDefinition` or
+    # `DataConnector`), its type, the ids it depends on, and its failover
+    # connector, or None for other elements.
     def parse_stanza(self, stanza):
-        if stanza.tag != self.xmlns('resolver', 'AttributeDefinition'):
+        kinds = {
+            self.xmlns('resolver', 'AttributeDefinition'): 'AttributeDefinition',
+            self.xmlns('resolver', 'DataConnector'): 'DataConnector',
+        }
+        if stanza.tag not in kinds:
             return None
-        return stanza.attrib.get(self.xmlns('xsi', 'type'))
+        dependency_tags = {
+            self.xmlns('resolver', 'InputAttributeDefinition'),
+            self.xmlns('resolver', 'InputDataConnector'),
+            self.xmlns('resolver', 'Dependency'),
+        }
+        failover_tag = self.xmlns('resolver', 'FailoverDataConnector')
+        dependencies = []
+        failover = None
+        for child in stanza:
+            if child.tag in dependency_tags:
+                dependencies.append(child.attrib.get('ref'))
+            elif child.tag == failover_tag:
+                failover = child.attrib.get('ref')
+        return {
+            'kind': kinds[stanza.tag],
+            'type': stanza.attrib.get(self.xmlns('xsi', 'type')),
+            'dependencies': dependencies,
+            'failover': failover,
+        }
@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+
+# The client side of the query daemon in `daemon.py`. The scripts import
+# this before anything else, so it must stay quick to import.
+
+import json
+import os
+
+# Where the daemon listens and the scripts look for it.
+DEFAULT_SOCKET = os.environ.get(
+    'IDP_UTILITIES_SOCKET',
+    f'/tmp/idp-utilities-{os.getuid()}.sock')
+
+
+# Sends a request to the query daemon and returns its output as a string.
+# Returns None if no daemon is listening or it can’t answer this request,
+# in which case the caller should do the work itself.
+def query_daemon(path, request, timeout=300):
+    if not path or not os.path.exists(path):
+        return None
+    import socket
+
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+            s.settimeout(timeout)
+            s.connect(path)
+            s.sendall(json.dumps(request).encode() + b'\n')
+            with s.makefile('rb') as f:
+                response = json.loads(f.readline())
+    except (OSError, ValueError):
+        return None
+    if not response.get('ok'):
+        return None
+    return response['output']
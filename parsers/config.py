@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+
+from .attribute_filter import AttributeFilterConfig
+from .attribute_resolver import AttributeResolverConfig
+from .metadata_resolver import MetadataResolverConfig
+from .services import ServicesConfig
+from .stats import RunStats
+from pathlib import Path
+import subprocess
+
+
+# Reads `config.yml` from an open file and fills in defaults.
+def load_config(stream, check_expiry=False):
+    import yaml
+
+    config = yaml.safe_load(stream)
+    config['check_expiry'] = check_expiry
+    # Set up defaults.
+    if 'shibboleth-root' not in config:
+        config['shibboleth-root'] = '/opt/shibboleth-idp'
+    config['shibboleth-root'] = Path(config['shibboleth-root']).resolve()
+    if 'properties' not in config:
+        config['properties'] = {}
+    if 'idp.home' not in config['properties']:
+        config['properties']['idp.home'] = str(config['shibboleth-root'])
+    if 'metadata-require' not in config:
+        config['metadata-require'] = ['%{idp.home}/metadata/idp-metadata.xml']
+    if not config.get('metadata-ignore'):
+        config['metadata-ignore'] = []
+    if 'xmllint' not in config:
+        config['xmllint'] = '/usr/bin/xmllint'
+    if 'xml-backend' not in config:
+        config['xml-backend'] = 'auto'
+    if 'xml-huge-tree' not in config:
+        config['xml-huge-tree'] = False
+    return config
+
+
+# Checks that every XML file in `conf/` and `metadata/` is well-formed.
+# With lxml, each file is parsed once, here, and the tree is kept for the
+# config file classes; otherwise xmllint (if configured) is run on each.
+# Raises ParseError or CalledProcessError on the first invalid file.
+def validate_xml(config, stats):
+    from ._xmlbackend import get_backend
+
+    backend = get_backend(config)
+    if not backend.validates and not config['xmllint']:
+        return
+    for dir in ['conf', 'metadata']:
+        files = config['shibboleth-root'].glob(f'{dir}/**/*.xml')
+        for file in files:
+            if backend.validates:
+                backend.validate(file)
+                stats.add('xml_validated_files')
+                continue
+            result = subprocess.run([config['xmllint'], '--noout', file])
+            result.check_returncode()
+            stats.add('xmllint_files')
+
+
+class IdPConfig(object):
+    """
+    The IdP configuration files that `check-config.py` compares with each
+    other: `conf/services.xml` and the metadata resolver, attribute filter,
+    and attribute resolver files it lists.
+    """
+
+    def __init__(self, config, stats=None):
+        self.config = config
+        self.stats = stats if stats is not None else RunStats(enabled=False)
+        services_filename = str(config['shibboleth-root'] / 'conf/services.xml')
+        self.services = ServicesConfig(config, [services_filename], self.stats)
+        self.metadata = MetadataResolverConfig(
+            config,
+            self.services.get_files('metadata'),
+            self.stats)
+        self.attr_filter = AttributeFilterConfig(
+            config,
+            self.services.get_files('attr-filter'),
+            self.stats)
+        self.attr_resolver = AttributeResolverConfig(
+            config,
+            self.services.get_files('attr-resolver'),
+            self.stats)
+
+    # Compares the attributes released by the filters with those the
+    # resolvers can produce, and checks that each released attribute’s
+    # dependencies can be resolved too.
+    def check_attributes(self):
+        released_attrs = self.attr_filter.get_released()
+        resolvable = set(self.attr_resolver.attributes())
+        for attr, ids in released_attrs.items():
+            if attr not in resolvable:
+                print(f'ERROR: Unresolvable attribute {attr} used by {ids}')
+        print('All released attributes are resolvable')
+        problems = self.attr_resolver.graph().problems()
+        for attr in released_attrs:
+            if attr in problems:
+                print(f'ERROR: Released attribute {attr} {problems[attr]}')
+        for attr in self.attr_resolver.attributes():
+            if attr not in released_attrs:
+                print(f'Attribute {attr} is resolvable but unused')
+
+    # Prints the data connectors each attribute relies on.
+    def report_depends(self, attrs):
+        graph = self.attr_resolver.graph()
+        for attr in attrs:
+            if attr not in self.attr_resolver.stanzas:
+                print(f'ERROR: No attribute or connector {attr}')
+                continue
+            connectors = graph.connectors_for(attr)
+            print(f'{attr}: {", ".join(connectors) if connectors else "(no data connectors)"}')
+
+    # Prints the released attributes that can’t be resolved if each data
+    # connector is down.
+    def report_impact(self, connectors):
+        graph = self.attr_resolver.graph()
+        released_attrs = self.attr_filter.get_released()
+        for connector in connectors:
+            if connector not in self.attr_resolver.stanzas or not graph.is_connector(connector):
+                print(f'ERROR: No data connector {connector}')
+                continue
+            affected = graph.affected_by(connector)
+            released = [attr for attr in affected if attr in released_attrs]
+            print(f'{connector}: {len(affected)} attributes affected, {len(released)} of them released')
+            for attr in released:
+                print(f'  - {attr} (released by {", ".join(released_attrs[attr])})')
+
+    # Runs the metadata and attribute checks, printing the results.
+    def check(self):
+        with self.stats.phase('check_files'):
+            self.metadata.check_files()
+        with self.stats.phase('compare attributes'):
+            self.check_attributes()
+
+    # Returns {filename: mtime} for every file this configuration was
+    # loaded from, plus the metadata directory, to detect changes.
+    def mtimes(self):
+        root = self.config['shibboleth-root']
+        filenames = [root / 'conf/services.xml']
+        for index in ['metadata', 'attr-filter', 'attr-resolver']:
+            filenames.extend(Path(f) for f in self.services.get_files(index))
+        filenames.extend((root / 'metadata').glob('**/*.xml'))
+        mtimes = {}
+        for filename in filenames:
+            try:
+                mtimes[str(filename)] = filename.stat().st_mtime
+            except FileNotFoundError:
+                mtimes[str(filename)] = None
+        return mtimes
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+
+from .client import query_daemon
+from contextlib import redirect_stdout
+from pathlib import Path
+import io
+import json
+import os
+import socketserver
+import sys
+import threading
+import time
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        try:
+            request = json.loads(self.rfile.readline())
+            output = self.server.query_daemon.answer(request)
+            response = {'ok': output is not None, 'output': output}
+        except Exception as e:
+            response = {'ok': False, 'error': f'{type(e).__name__}: {e}'}
+        self.wfile.write(json.dumps(response).encode() + b'\n')
+
+
+class QueryDaemon(object):
+    """
+    Keeps the parsed IdP configuration and log counts in memory and
+    answers queries from `logscan.py`, `check-config.py`, and
+    `attributes.py` over a Unix socket, so they don’t each have to load
+    and parse everything again.
+
+    Every `interval` seconds it checks the config and log files for
+    changes: changed config is reloaded, and new lines in the logs are
+    parsed and added to what it already has. Logs are kept as counts of
+    logins per principal, requester, and day, and, for the detail view,
+    per principal, requester, time (to the second), and IP address,
+    rather than as parsed events.
+
+    Requests it can’t answer the same way the script would — a different
+    config file or set of logs, say — get no answer, and the script falls
+    back to doing the work itself.
+    """
+
+    def __init__(self, config_filename, log_filenames, interval=5):
+        from .shibboleth import ShibbolethLog
+
+        self.config_filename = str(Path(config_filename).resolve()) if config_filename else None
+        self.log_filenames = [os.path.realpath(f) for f in log_filenames]
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.config = None
+        self.idp = None
+        self.mtimes = {}
+        # Reused for every attributes query, which is otherwise answered
+        # by asking the IdP just as `attributes.py` would.
+        self.ssl_context = None
+        self.log = ShibbolethLog(
+            principal=None, requester=None, daily=False, output=None, prefetch=False, aggregate=True)
+        # The first load skips or trims files that repeat others, the
+        # same way a scan does; after that, only new lines are read.
+        self.log.load_all(self.log_filenames, follow=True)
+        print(f'Loaded {len(self.log_filenames)} log files: {self.log.aggregated} logins', file=sys.stderr)
+        self.refresh()
+
+    def answer(self, request):
+        command = request.get('command', '')
+        if command == 'ping':
+            return 'pong\n'
+        method = getattr(self, 'answer_' + command.replace('-', '_'), None)
+        if method is None:
+            raise ValueError(f'Unknown command {command}')
+        with self.lock:
+            return method(request)
+
+    def answer_attributes(self, request):
+        from .resolvertest import make_context, resolver_test
+
+        if request['config'] != self.config_filename or self.config is None:
+            return None
+        if self.ssl_context is None:
+            self.ssl_context = make_context()
+        return resolver_test(
+            self.config, request['principal'], request['requester'], request['format'], self.ssl_context) + '\n'
+
+    def answer_check_config(self, request):
+        if request['config'] != self.config_filename or self.idp is None:
+            return None
+        self.config['check_expiry'] = request['cert']
+        output = io.StringIO()
+        with redirect_stdout(output):
+            self.idp.check()
+        return output.getvalue()
+
+    def answer_logscan(self, request):
+        from .shibboleth import ShibbolethLog
+
+        filenames = sorted(os.path.realpath(f) for f in request['filename'])
+        if filenames != sorted(self.log_filenames):
+            return None
+        log = ShibbolethLog(
+            principal=request['principal'],
+            requester=request['requester'],
+            daily=request['daily'],
+            output=None)
+        output = io.StringIO()
+        with redirect_stdout(output):
+            log.count_aggregates(self.log.totals, self.log.details)
+            log.output_results()
+        return output.getvalue()
+
+    # Returns {filename: mtime} for the config file and everything
+    # loaded because of it.
+    def config_mtimes(self):
+        mtimes = {self.config_filename: os.stat(self.config_filename).st_mtime}
+        if self.idp is not None:
+            mtimes.update(self.idp.mtimes())
+        return mtimes
+
+    def refresh(self):
+        with self.lock:
+            if self.config_filename and self.config_mtimes() != self.mtimes:
+                self.reload_config()
+            for filename in self.log_filenames:
+                if self.log.load_new(filename):
+                    print(f'Loaded {filename}: {self.log.aggregated} logins in total', file=sys.stderr)
+
+    # Loads the configuration the same way `check-config.py` does. If it
+    # fails, config queries go unanswered until the files change again.
+    def reload_config(self):
+        from ._xmlbackend import get_backend
+        from .config import IdPConfig, load_config, validate_xml
+        from .stats import RunStats
+
+        self.config = self.idp = None
+        try:
+            with open(self.config_filename) as f:
+                self.config = load_config(f)
+            validate_xml(self.config, RunStats(enabled=False))
+            self.idp = IdPConfig(self.config)
+            with redirect_stdout(io.StringIO()):
+                self.idp.metadata.load_files()
+        except Exception as e:
+            print(f'ERROR: Can’t load {self.config_filename}: {type(e).__name__}: {e}', file=sys.stderr)
+            self.idp = None
+        else:
+            print(f'Loaded {self.config_filename}', file=sys.stderr)
+        finally:
+            # Trees validated but not parsed by any config file class
+            # would otherwise be kept for as long as the daemon runs.
+            if self.config is not None:
+                get_backend(self.config).release()
+        self.mtimes = self.config_mtimes()
+
+    # Listens on the Unix socket until interrupted, refreshing in a
+    # background thread. Only the owner may connect.
+    def serve(self, path):
+        if query_daemon(path, {'command': 'ping'}, timeout=5) is not None:
+            raise RuntimeError(f'Another daemon is already listening on {path}')
+        if os.path.exists(path):
+            os.unlink(path)
+        umask = os.umask(0o177)
+        try:
+            server = socketserver.ThreadingUnixStreamServer(path, _Handler)
+        finally:
+            os.umask(umask)
+        server.daemon_threads = True
+        server.query_daemon = self
+        threading.Thread(target=self.watch, daemon=True).start()
+        try:
+            server.serve_forever()
+        finally:
+            server.server_close()
+            os.unlink(path)
+
+    def watch(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f'ERROR: Refresh failed: {type(e).__name__}: {e}', file=sys.stderr)
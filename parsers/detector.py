@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+
+from collections import OrderedDict
+
+
+class SlidingWindow(object):
+    """
+    A count of events over the last `size` minutes, kept as a ring of
+    per-minute buckets. Adding an event is O(1), plus clearing the
+    buckets for any minutes skipped since the last one (at most `size`).
+    """
+
+    __slots__ = ['counts', 'last', 'quiet_until', 'total']
+
+    def __init__(self, size):
+        self.counts = [0] * size
+        self.last = None
+        self.total = 0
+        # No more alerts for this key until after this minute.
+        self.quiet_until = None
+
+    # Adds `count` events in the given minute (as an integer), and
+    # returns the number in the window ending then.
+    def add(self, minute, count=1):
+        size = len(self.counts)
+        if self.last is None:
+            self.last = minute
+        elif minute > self.last:
+            # Clear the buckets for the minutes we’ve moved past.
+            for skipped in range(self.last + 1, min(minute, self.last + size) + 1):
+                self.total -= self.counts[skipped % size]
+                self.counts[skipped % size] = 0
+            self.last = minute
+        elif minute <= self.last - size:
+            # Too old to be in the window.
+            return self.total
+        self.counts[minute % size] += count
+        self.total += count
+        return self.total
+
+
+class FailureDetector(object):
+    """
+    Watches failed logins and calls `alert(time, kind, key, failures)`
+    when the failures in the last `window` minutes from one IP address
+    (`kind` 'ip', e.g. credential stuffing) or for one principal
+    ('principal', e.g. a lockout storm) reach that kind’s threshold.
+    A key alerts at most once per window.
+
+    Windows are kept in least-recently-used order, so keys with no
+    failures in the last window are dropped as time moves on, and the
+    least recently seen are dropped if there are more than `max_keys`.
+    """
+
+    def __init__(self, alert, window=10, ip_threshold=20, principal_threshold=5, max_keys=100000):
+        self.alert = alert
+        self.window = window
+        self.thresholds = {'ip': ip_threshold, 'principal': principal_threshold}
+        self.max_keys = max_keys
+        self.windows = {'ip': OrderedDict(), 'principal': OrderedDict()}
+        self.evicted = 0
+
+    # Counts a Login event if it failed.
+    def add(self, event):
+        if event.success:
+            return
+        t = event.time
+        minute = t.toordinal() * 1440 + t.hour * 60 + t.minute
+        self.count('ip', event.ip_addr, minute, t)
+        self.count('principal', event.user, minute, t)
+
+    def count(self, kind, key, minute, time):
+        if key is None:
+            return
+        windows = self.windows[kind]
+        window = windows.get(key)
+        if window is None:
+            window = windows[key] = SlidingWindow(self.window)
+        else:
+            windows.move_to_end(key)
+        failures = window.add(minute)
+        if failures >= self.thresholds[kind] and (window.quiet_until is None or minute > window.quiet_until):
+            window.quiet_until = minute + self.window
+            self.alert(time, kind, key, failures)
+        self.evict(windows, minute)
+
+    # Drops windows that have had no failures for a whole window, and
+    # the least recently used if there are too many.
+    def evict(self, windows, minute):
+        while windows:
+            key, oldest = next(iter(windows.items()))
+            if oldest.last > minute - self.window and len(windows) <= self.max_keys:
+                break
+            del windows[key]
+            self.evicted += 1
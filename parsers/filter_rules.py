@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+
+# Compiled forms of the rules in attribute filter policies, so
+# `AttributeFilterConfig.simulate()` can work out what the IdP would
+# release to a requester without asking it.
+#
+# Rules are evaluated with `reduce(context)`, which returns True or False
+# when the rule’s outcome is known, None when it depends on something we
+# can’t know offline (such as a scripted rule), or a rule that depends
+# only on the attribute’s values, such as `Value`. The functions
+# `conjoin()`, `disjoin()`, and `negate()` combine those results.
+
+import re
+
+
+class RequestContext(object):
+    """
+    What we know about a simulated request. `principal` may be None if
+    it isn’t known, and `groups` (the requester’s entity groups) may be
+    None if they aren’t known either; rules that test them then reduce to
+    None rather than False.
+    """
+
+    def __init__(self, requester, principal=None, groups=None):
+        self.requester = requester
+        self.principal = principal
+        self.groups = None if groups is None else set(groups)
+
+
+# Returns the result of a rule that is true if all of `results` are.
+def conjoin(results):
+    rest = []
+    unknown = False
+    for result in results:
+        if result is False:
+            return False
+        if result is None:
+            unknown = True
+        elif result is not True:
+            rest.append(result)
+    if unknown:
+        return None
+    if not rest:
+        return True
+    return rest[0] if len(rest) == 1 else And(rest)
+
+
+# Returns the result of a rule that is true if any of `results` are.
+def disjoin(results):
+    rest = []
+    unknown = False
+    for result in results:
+        if result is True:
+            return True
+        if result is None:
+            unknown = True
+        elif result is not False:
+            rest.append(result)
+    if unknown:
+        return None
+    if not rest:
+        return False
+    return rest[0] if len(rest) == 1 else Or(rest)
+
+
+def negate(result):
+    if result is None or isinstance(result, bool):
+        return None if result is None else not result
+    return Not(result)
+
+
+# Returns a description of a reduced result for an attribute.
+def describe_release(result):
+    if result is True:
+        return 'all values'
+    if result is None:
+        return 'maybe (depends on the principal, entity groups, or rules that can’t be checked offline)'
+    return f'values where {result.describe()}'
+
+
+class _Rule(object):
+    def reduce(self, context):
+        raise NotImplementedError
+
+    # Returns a set of ('requester', lowercased entityID) and ('group',
+    # name) keys, at least one of which must match the request for this
+    # rule to be true, or None if there is no such set.
+    def index_keys(self):
+        return None
+
+    def describe(self):
+        return type(self).__name__
+
+
+class _StringRule(_Rule):
+    def __init__(self, value, case_sensitive=True):
+        self.value = value
+        self.case_sensitive = case_sensitive
+        self.folded = value if case_sensitive else value.lower()
+
+    def matches(self, text):
+        if text is None:
+            return None
+        return (text if self.case_sensitive else text.lower()) == self.folded
+
+
+class _RegexRule(_Rule):
+    def __init__(self, regex, case_sensitive=True):
+        self.regex = regex
+        self.pattern = re.compile(regex, 0 if case_sensitive else re.IGNORECASE)
+
+    # Regexes must match the whole string, as with Java’s `matches()`.
+    def matches(self, text):
+        if text is None:
+            return None
+        return self.pattern.fullmatch(text) is not None
+
+
+class Any(_Rule):
+    def reduce(self, context):
+        return True
+
+
+class And(_Rule):
+    def __init__(self, rules):
+        self.rules = rules
+
+    def reduce(self, context):
+        return conjoin(rule.reduce(context) for rule in self.rules)
+
+    # Any one rule’s keys are necessary, so use the most selective.
+    def index_keys(self):
+        keys = [rule.index_keys() for rule in self.rules]
+        keys = [k for k in keys if k is not None]
+        return min(keys, key=len) if keys else None
+
+    def describe(self):
+        return ' and '.join(f'({rule.describe()})' for rule in self.rules)
+
+    def test(self, value):
+        return all(rule.test(value) for rule in self.rules)
+
+
+class Or(_Rule):
+    def __init__(self, rules):
+        self.rules = rules
+
+    def reduce(self, context):
+        return disjoin(rule.reduce(context) for rule in self.rules)
+
+    # Every rule needs keys, since any one of them may be the true one.
+    def index_keys(self):
+        keys = set()
+        for rule in self.rules:
+            rule_keys = rule.index_keys()
+            if rule_keys is None:
+                return None
+            keys |= rule_keys
+        return keys
+
+    def describe(self):
+        return ' or '.join(f'({rule.describe()})' for rule in self.rules)
+
+    def test(self, value):
+        return any(rule.test(value) for rule in self.rules)
+
+
+class Not(_Rule):
+    def __init__(self, rule):
+        self.rule = rule
+
+    def reduce(self, context):
+        return negate(self.rule.reduce(context))
+
+    def describe(self):
+        return f'not ({self.rule.describe()})'
+
+    def test(self, value):
+        return not self.rule.test(value)
+
+
+class Requester(_StringRule):
+    def reduce(self, context):
+        return self.matches(context.requester)
+
+    def index_keys(self):
+        return {('requester', self.value.lower())}
+
+
+class RequesterRegex(_RegexRule):
+    def reduce(self, context):
+        return self.matches(context.requester)
+
+
+class InEntityGroup(_Rule):
+    def __init__(self, group):
+        self.group = group
+
+    def reduce(self, context):
+        if context.groups is None:
+            return None
+        return self.group in context.groups
+
+    def index_keys(self):
+        return {('group', self.group)}
+
+
+class Principal(_StringRule):
+    def reduce(self, context):
+        return self.matches(context.principal)
+
+
+class PrincipalRegex(_RegexRule):
+    def reduce(self, context):
+        return self.matches(context.principal)
+
+
+# Value rules depend on the attribute’s values, so they reduce to
+# themselves; `test()` checks a single value.
+class Value(_StringRule):
+    def reduce(self, context):
+        return self
+
+    def describe(self):
+        return f'value = {self.value!r}'
+
+    def test(self, value):
+        return self.matches(value)
+
+
+class ValueRegex(_RegexRule):
+    def reduce(self, context):
+        return self
+
+    def describe(self):
+        return f'value matches /{self.regex}/'
+
+    def test(self, value):
+        return self.matches(value)
+
+
+class Scope(Value):
+    def describe(self):
+        return f'scope = {self.value!r}'
+
+    def test(self, value):
+        return self.matches(value.rpartition('@')[2])
+
+
+class ScopeRegex(ValueRegex):
+    def describe(self):
+        return f'scope matches /{self.regex}/'
+
+    def test(self, value):
+        return self.matches(value.rpartition('@')[2])
+
+
+# A rule type we can’t evaluate offline (scripts, NameID formats, and
+# so on), or one that tests another attribute’s values.
+class Unsupported(_Rule):
+    def __init__(self, name):
+        self.name = name
+
+    def reduce(self, context):
+        return None
+
+    def describe(self):
+        return self.name
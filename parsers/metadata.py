@@ -5,7 +5,6 @@ from cryptography import x509
 from cryptography.hazmat.backends import default_backend
 from datetime import datetime, timedelta, timezone
 import base64
-import xml.etree.ElementTree as ET
 
 
 class MetadataConfig(_ConfigFile):
@@ -14,9 +13,10 @@ class MetadataConfig(_ConfigFile):
     """
     # Inherited variables:
     #     PATH_SUB = re.compile(...)
+    #     TAGS = {...}
     #     XMLNS = {...}
     # Inherited methods:
-    #     __init__(self, config, filenames)
+    #     __init__(self, config, filenames, stats=None)
     #     make_path(self, text)
     #     translate_config(self)
     #     xmlns(self, ns, item)
@@ -49,8 +49,8 @@ class MetadataConfig(_ConfigFile):
     # Overrides _ConfigFile.load_stanzas because we want to work with
     # the root element as a single stanza.
     def load_stanzas(self, filename):
-        tree = ET.parse(filename)
-        root = tree.getroot()
+        with self.stats.phase('xml parse'):
+            root = self.xml.parse(filename)
         id = root.attrib.get('entityID')
         try:
             stanza = self.parse_stanza(root)
@@ -66,12 +66,14 @@ class MetadataConfig(_ConfigFile):
             print(f'Unknown tag: {stanza.tag}')
             return None
         valid_until = stanza.attrib.get('validUntil')
-        x509_tag = self.xmlns('ds', 'X509Certificate')
+        find_certs = self.xml.compile_path('.//ds:X509Certificate', self.XMLNS)
         certs = []
-        for x509cert in stanza.findall(f'.//{x509_tag}'):
-            text = base64.standard_b64decode(x509cert.text)
-            cert = x509.load_der_x509_certificate(text, default_backend())
-            certs.append(cert)
+        with self.stats.phase('cert decode'):
+            for x509cert in find_certs(stanza):
+                text = base64.standard_b64decode(x509cert.text)
+                cert = x509.load_der_x509_certificate(text, default_backend())
+                certs.append(cert)
+        self.stats.add('certs', len(certs))
         return {
             'valid_until': valid_until,
             'certs': certs,
@@ -1,8 +1,6 @@
 #!/usr/bin/env python3
 
-from . import MetadataConfig
 from ._configfile import _ConfigFile
-import cryptography
 import re
 
 
@@ -13,31 +11,40 @@ class MetadataResolverConfig(_ConfigFile):
     """
     # Inherited variables:
     #     PATH_SUB = re.compile(...)
+    #     TAGS = {...}
     #     XMLNS = {...}
     # Inherited methods:
-    #     __init__(self, config, filenames)
+    #     __init__(self, config, filenames, stats=None)
     #     load_stanzas(self, filename)
     #     make_path(self, text)
     #     translate_config(self)
     #     xmlns(self, ns, item)
 
+    # Characters that aren’t allowed in a provider id.
+    INVALID_ID_CHAR = re.compile(r'([^\w-])')
+
+    # Parsed files from the metadata directory, once loaded.
+    metadata_files = None
+
     # Compare the contents of the metadata directory with the list
     # of files expected by the metadata resolver config files, plus
     # anything required by `config.yml`.
     def check_files(self):
-        files = self.load_files()
+        with self.stats.phase('load_files'):
+            files = self.load_files()
         missing = {}
 
         # Check expiration of metadata.
         if self.config['check_expiry']:
-            for filename, metadata in files.items():
-                if filename in self.config['metadata-ignore']:
-                    continue
-                expiry = metadata.check_expiry()
-                if (expiry):
-                    print(filename)
-                    for note in expiry:
-                        print(f'  - {note}')
+            with self.stats.phase('check_expiry'):
+                for filename, metadata in files.items():
+                    if filename in self.config['metadata-ignore']:
+                        continue
+                    expiry = metadata.check_expiry()
+                    if (expiry):
+                        print(filename)
+                        for note in expiry:
+                            print(f'  - {note}')
 
         # Check for everything required by config.
         for i, check in enumerate(self.config['metadata-require'], start=1):
@@ -67,16 +74,49 @@ class MetadataResolverConfig(_ConfigFile):
             for filename, _ in files.items():
                 print(f'  - {filename}')
 
-    # Returns a list of strings which are fully qualified filenames
-    # from the IdP’s `metadata/` directory and all subdirectories.
+    # Asks the source of each FileBackedHTTPMetadataProvider whether it
+    # has changed since its backing file was written, and reports which
+    # backing files are stale. `state` is a JSON file of the validators
+    # from the last run, to send back and then update.
+    def check_refresh(self, state=None, download=None, concurrency=8, timeout=30):
+        from .refresh import MetadataRefreshChecker, load_state, save_state
+
+        providers = {id: stanza for id, stanza in self.stanzas.items() if stanza['url']}
+        if not providers:
+            print('No FileBackedHTTPMetadataProvider sources to check')
+            return
+        known = load_state(state) if state else {}
+        checker = MetadataRefreshChecker(providers, known, download, concurrency, timeout, self.xml)
+        with self.stats.phase('metadata refresh'):
+            results = checker.run()
+        stale = 0
+        for result in results:
+            print(result.describe())
+            if result.status != 'current':
+                stale += 1
+            self.stats.add('refresh_bytes', result.bytes)
+            self.stats.add(f'refresh_{result.status}')
+        if not stale:
+            print('All metadata backing files are current')
+        if state:
+            save_state(state, known, results)
+
+    # Returns a dict of fully qualified filenames from the IdP’s
+    # `metadata/` directory and all subdirectories, with their parsed
+    # MetadataConfig. They are parsed once and kept for later calls;
+    # each call returns a new dict that the caller may change.
     def load_files(self):
-        metadata_dir = self.config['shibboleth-root'] / 'metadata'
-        files = {}
-        for filename in metadata_dir.glob('**/*.xml'):
-            if str(filename) in self.config['metadata-ignore']:
-                continue
-            files[str(filename)] = MetadataConfig(self.config, [filename])
-        return files
+        if self.metadata_files is None:
+            # Deferred because it loads cryptography.
+            from .metadata import MetadataConfig
+
+            metadata_dir = self.config['shibboleth-root'] / 'metadata'
+            self.metadata_files = {}
+            for filename in metadata_dir.glob('**/*.xml'):
+                if str(filename) in self.config['metadata-ignore']:
+                    continue
+                self.metadata_files[str(filename)] = MetadataConfig(self.config, [filename], self.stats)
+        return dict(self.metadata_files)
 
     # Returns a dict summarizing the requirement: what filename
     # we expect and whether we can allow it to be missing.
@@ -84,16 +124,18 @@ class MetadataResolverConfig(_ConfigFile):
         if stanza.tag != self.xmlns('metadata', 'MetadataProvider'):
             return None
         id = stanza.attrib.get('id')
-        char = re.search(r'([^\w-])', id)
+        char = self.INVALID_ID_CHAR.search(id)
         if char:
             raise ValueError(f'Invalid character "{char.group(1)}" in {id}')
         filename = None
+        url = None
         required = True
         xsi_type = stanza.attrib.get(self.xmlns('xsi', 'type'))
         if xsi_type == 'FilesystemMetadataProvider':
             filename = stanza.attrib.get('metadataFile')
         elif xsi_type == 'FileBackedHTTPMetadataProvider':
             filename = stanza.attrib.get('backingFile')
+            url = stanza.attrib.get('metadataURL')
             required = False
         else:
             raise ValueError(f'Can’t parse stanza with id {id}')
@@ -101,5 +143,6 @@ class MetadataResolverConfig(_ConfigFile):
             raise ValueError(f'Can’t find filename in stanza with id {id}')
         return {
             'filename': self.make_path(filename),
+            'url': self.make_path(url) if url else None,
             'required': required,
         }
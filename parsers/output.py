@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+
+# Output files for `logscan.py`. Each report (requesters, principals,
+# entries, ...) gets one sink, opened once per run and written through a
+# large buffer, so writing many rows costs few system calls. A sink is a
+# file in the output directory, or stdout if there isn’t one.
+
+import csv
+import io
+import json
+import os
+import sys
+
+# Formats, and the extension for each.
+FORMATS = {
+    'csv': '.csv',
+    'tsv': '.tsv',
+    'jsonl': '.jsonl',
+    'text': '.log',
+}
+
+# Compression methods, and the extension for each.
+COMPRESSORS = {
+    'gzip': '.gz',
+    'zstd': '.zst',
+}
+
+BUFFER_BYTES = 1 << 20
+
+
+# Opens a file for writing text, compressed with `compress` if given.
+def open_stream(filename, compress=None):
+    if compress is None:
+        return open(filename, 'w', buffering=BUFFER_BYTES, encoding='utf-8', newline='')
+    if compress == 'gzip':
+        import gzip
+        binary = gzip.open(filename, 'wb', compresslevel=6)
+    elif compress == 'zstd':
+        try:
+            import zstandard
+        except ImportError:
+            raise RuntimeError('zstd compression needs the zstandard package') from None
+        binary = zstandard.ZstdCompressor().stream_writer(open(filename, 'wb'))
+    else:
+        raise ValueError(f'Unknown compression {compress}')
+    return io.TextIOWrapper(io.BufferedWriter(binary, BUFFER_BYTES), encoding='utf-8', newline='')
+
+
+class OutputSink(object):
+    """
+    Writes rows (lists of values, in the order of `columns`) in one of
+    the formats: `csv` and `tsv` (with a header row of the column names
+    only if `header` is true), `jsonl` (one object per row, keyed by
+    column name), or `text` (each row formatted with `template`).
+    """
+
+    def __init__(self, stream, format='csv', columns=(), header=False, template=None, close=True):
+        if format not in FORMATS:
+            raise ValueError(f'Unknown output format {format}')
+        self.stream = stream
+        self.format = format
+        self.columns = list(columns)
+        self.template = template
+        self.must_close = close
+        if format in ['csv', 'tsv']:
+            self.writer = csv.writer(stream, delimiter=',' if format == 'csv' else '\t')
+            if header:
+                self.writer.writerow(self.columns)
+        elif format == 'text' and template is None:
+            raise ValueError('Text output needs a template')
+
+    def write(self, row):
+        if self.format == 'jsonl':
+            self.stream.write(json.dumps(dict(zip(self.columns, row))) + '\n')
+        elif self.format == 'text':
+            self.stream.write(self.template.format(*row) + '\n')
+        else:
+            self.writer.writerow(row)
+
+    def writerows(self, rows):
+        if self.format in ['csv', 'tsv']:
+            self.writer.writerows(rows)
+            return
+        for row in rows:
+            self.write(row)
+
+    def flush(self):
+        self.stream.flush()
+
+    def close(self):
+        if self.must_close:
+            self.stream.close()
+        else:
+            self.stream.flush()
+
+
+# Returns a sink for the named report: `<subject>.<format>[.gz|.zst]`
+# in `directory`, or stdout if `directory` is None.
+def open_sink(directory, subject, format='csv', columns=(), header=False, template=None, compress=None):
+    if directory is None:
+        return OutputSink(sys.stdout, format, columns, header, template, close=False)
+    filename = os.path.join(directory, subject + FORMATS[format] + COMPRESSORS.get(compress, ''))
+    return OutputSink(open_stream(filename, compress), format, columns, header, template)
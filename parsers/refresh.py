@@ -0,0 +1,378 @@
+#!/usr/bin/env python3
+
+# Checks whether the backing files of FileBackedHTTPMetadataProvider
+# sources are up to date with their `metadataURL`. Every server is asked
+# at once (up to a limit), with a conditional GET if we have validators
+# from an earlier run, so an unchanged source costs one round trip and
+# no body. Bodies are streamed through a hash, the XML pull parser, and
+# optionally a file, a chunk at a time, so large aggregates are never
+# held in memory.
+
+import asyncio
+import hashlib
+import json
+import os
+import tempfile
+from datetime import datetime, timezone
+from urllib.parse import urljoin, urlsplit
+
+CHUNK_BYTES = 1 << 16
+MAX_REDIRECTS = 5
+REDIRECTS = [301, 302, 303, 307, 308]
+MD_NS = '{urn:oasis:names:tc:SAML:2.0:metadata}'
+
+
+# Returns the SHA-256 of a file as hex, or None if it doesn’t exist.
+def file_digest(filename):
+    digest = hashlib.sha256()
+    try:
+        with open(filename, 'rb') as f:
+            for chunk in iter(lambda: f.read(CHUNK_BYTES), b''):
+                digest.update(chunk)
+    except FileNotFoundError:
+        return None
+    return digest.hexdigest()
+
+
+class _BodySink(object):
+    """
+    Takes a response body a chunk at a time: hashes it, parses it as
+    metadata with the XML backend’s pull parser (keeping only the root’s
+    validUntil and a count of entities), and writes it to `filename` if
+    given. The file is written under a unique temporary name in the same
+    directory and only moved into place by `finish()` if the body was
+    complete, well-formed XML.
+    """
+
+    def __init__(self, backend, filename=None):
+        self.digest = hashlib.sha256()
+        self.backend = backend
+        self.parser = backend.pull_parser(events=('start', 'end'))
+        self.root = None
+        self.entities = 0
+        self.bytes = 0
+        self.filename = filename
+        self.file = None
+        if filename:
+            fd, self.temp = tempfile.mkstemp(
+                prefix='.' + os.path.basename(filename) + '.',
+                suffix='.part',
+                dir=os.path.dirname(filename) or None)
+            self.file = os.fdopen(fd, 'wb')
+
+    def write(self, chunk):
+        self.bytes += len(chunk)
+        self.digest.update(chunk)
+        if self.file:
+            self.file.write(chunk)
+        self.parser.feed(chunk)
+        self.read_events()
+
+    def read_events(self):
+        for event, elem in self.parser.read_events():
+            if event == 'start':
+                if self.root is None:
+                    self.root = elem
+            elif elem.tag == MD_NS + 'EntityDescriptor':
+                self.entities += 1
+                # Drop what we’ve parsed, so aggregates don’t pile up.
+                elem.clear()
+
+    # Returns an error message, or None if the body was good.
+    def finish(self):
+        error = None
+        try:
+            self.parser.close()
+            self.read_events()
+        except self.backend.ParseError as e:
+            error = f'invalid XML: {e}'
+        if self.file:
+            if error:
+                self.abort()
+                return error
+            try:
+                self.file.close()
+                os.replace(self.temp, self.filename)
+            except OSError as e:
+                self.abort()
+                return f'can’t save {self.filename}: {e}'
+        return error
+
+    def abort(self):
+        if self.file:
+            self.file.close()
+            try:
+                os.unlink(self.temp)
+            except FileNotFoundError:
+                pass
+
+    def valid_until(self):
+        return None if self.root is None else self.root.attrib.get('validUntil')
+
+
+class RefreshResult(object):
+    """
+    What we found for one provider. `status` is 'current' if the backing
+    file matches what the server has, 'stale' if it doesn’t, 'missing' if
+    there is no backing file, or 'error' if we couldn’t tell.
+    """
+
+    def __init__(self, id, url, filename):
+        self.id = id
+        self.url = url
+        self.filename = filename
+        self.status = None
+        self.http_status = None
+        self.etag = None
+        self.last_modified = None
+        self.sha256 = None
+        self.bytes = 0
+        self.entities = None
+        self.valid_until = None
+        self.error = None
+        self.downloaded = None
+
+    # Returns a line for the report.
+    def describe(self):
+        if self.status == 'error':
+            return f'ERROR: {self.id} can’t check {self.url}: {self.error}'
+        if self.status == 'current':
+            how = 'not modified' if self.http_status == 304 else 'unchanged'
+            return f'{self.id}: current ({how})'
+        notes = [f'{self.entities} entities']
+        if self.last_modified:
+            notes.append(f'last modified {self.last_modified}')
+        if self.valid_until:
+            notes.append(f'valid until {self.valid_until}')
+        source = f'source has {", ".join(notes)}'
+        if self.status == 'missing':
+            return f'WARNING: {self.id} has no backing file {self.filename} ({source})'
+        return f'WARNING: {self.id} backing file {self.filename} is stale ({source})'
+
+
+class MetadataRefreshChecker(object):
+    """
+    Checks each provider in `providers` ({id: {'url', 'filename'}}), at
+    most `concurrency` at a time.
+
+    `state` is {url: {'etag', 'last_modified', 'sha256'}} from an earlier
+    run, as returned by `load_state()`. A provider’s ETag and Last-Modified
+    are only sent back if the backing file still has the digest the
+    server sent with them; otherwise the GET is unconditional, and the
+    body is compared with the backing file. If `download` is a
+    directory, any body the server sends is saved there as
+    `<provider id>-<backing file name>`. Bodies are parsed with `backend`
+    (see `_xmlbackend.py`), or ElementTree if it isn’t given.
+    """
+
+    def __init__(self, providers, state=None, download=None, concurrency=8, timeout=30, backend=None):
+        if backend is None:
+            from ._xmlbackend import ElementTreeBackend
+            backend = ElementTreeBackend()
+        self.backend = backend
+        self.providers = providers
+        self.state = state if state is not None else {}
+        self.download = download
+        self.concurrency = concurrency
+        self.timeout = timeout
+
+    def run(self):
+        return asyncio.run(self.check_all())
+
+    async def check_all(self):
+        self.ssl = None
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        # One provider’s failure is reported as its result, rather than
+        # abandoning the others.
+        async def limited(id, provider):
+            async with semaphore:
+                try:
+                    return await self.check(id, provider)
+                except Exception as e:
+                    result = RefreshResult(id, provider['url'], provider['filename'])
+                    result.status = 'error'
+                    result.error = f'{type(e).__name__}: {e}'
+                    return result
+
+        return await asyncio.gather(*(limited(id, p) for id, p in self.providers.items()))
+
+    async def check(self, id, provider):
+        result = RefreshResult(id, provider['url'], provider['filename'])
+        # Hashing a large backing file shouldn’t hold up the other requests.
+        loop = asyncio.get_running_loop()
+        digest = await loop.run_in_executor(None, file_digest, result.filename)
+        headers = {}
+        known = self.state.get(result.url)
+        # Only validators from a response whose body the backing file
+        # still matches: its mtime says nothing about whether it is whole.
+        if digest and known and known.get('sha256') == digest:
+            if known.get('etag'):
+                headers['If-None-Match'] = known['etag']
+            if known.get('last_modified'):
+                headers['If-Modified-Since'] = known['last_modified']
+
+        filename = None
+        if self.download:
+            # Backing files in different directories may share a name.
+            name = f'{id}-{os.path.basename(result.filename)}'.replace(os.sep, '_')
+            filename = os.path.join(self.download, name)
+        body = None
+        try:
+            body = _BodySink(self.backend, filename)
+            status, response = await self.fetch(result.url, headers, body)
+        except (OSError, asyncio.TimeoutError, ValueError, self.backend.ParseError) as e:
+            if body is not None:
+                body.abort()
+            result.status = 'error'
+            result.error = str(e) or type(e).__name__
+            return result
+
+        result.http_status = status
+        result.etag = response.get('etag')
+        result.last_modified = response.get('last-modified')
+        if status == 304:
+            body.abort()
+            result.status = 'current'
+            result.sha256 = digest
+            # A 304 needn’t repeat the validators.
+            if known and result.etag is None:
+                result.etag = known.get('etag')
+            if known and result.last_modified is None:
+                result.last_modified = known.get('last_modified')
+        elif status == 200:
+            error = body.finish()
+            if error:
+                result.status = 'error'
+                result.error = error
+                return result
+            result.sha256 = body.digest.hexdigest()
+            result.bytes = body.bytes
+            result.entities = body.entities
+            result.valid_until = body.valid_until()
+            result.downloaded = filename
+            if digest is None:
+                result.status = 'missing'
+            else:
+                result.status = 'current' if digest == result.sha256 else 'stale'
+        else:
+            body.abort()
+            result.status = 'error'
+            result.error = f'HTTP status {status}'
+        return result
+
+    # Sends a GET for `url`, following redirects, and writes a 200
+    # response’s body to `body`. Returns (status, {lowercased header: value}).
+    async def fetch(self, url, headers, body):
+        for _ in range(MAX_REDIRECTS + 1):
+            parts = urlsplit(url)
+            if parts.scheme not in ['http', 'https'] or not parts.hostname:
+                raise ValueError(f'Can’t fetch {url}')
+            ssl = None
+            if parts.scheme == 'https':
+                if self.ssl is None:
+                    import ssl as _ssl
+                    self.ssl = _ssl.create_default_context()
+                ssl = self.ssl
+            port = parts.port or (443 if ssl else 80)
+            reader, writer = await asyncio.wait_for(
+                asyncio.open_connection(parts.hostname, port, ssl=ssl), self.timeout)
+            try:
+                host = parts.hostname if parts.port is None else f'{parts.hostname}:{parts.port}'
+                path = (parts.path or '/') + (f'?{parts.query}' if parts.query else '')
+                lines = [
+                    f'GET {path} HTTP/1.1',
+                    f'Host: {host}',
+                    'User-Agent: idp-utilities',
+                    'Accept-Encoding: identity',
+                    'Connection: close',
+                ]
+                lines.extend(f'{name}: {value}' for name, value in headers.items())
+                writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+                await writer.drain()
+                status, response = await self.read_head(reader)
+                if status in REDIRECTS and 'location' in response:
+                    url = urljoin(url, response['location'])
+                    continue
+                if status == 200:
+                    await self.read_body(reader, response, body)
+                return status, response
+            finally:
+                writer.close()
+                try:
+                    await writer.wait_closed()
+                except OSError:
+                    pass
+        raise ValueError(f'Too many redirects from {url}')
+
+    async def readline(self, reader):
+        line = await asyncio.wait_for(reader.readline(), self.timeout)
+        if not line.endswith(b'\n'):
+            raise ValueError('Connection closed early')
+        return line.decode('latin-1').rstrip('\r\n')
+
+    async def read_head(self, reader):
+        status_line = await self.readline(reader)
+        try:
+            status = int(status_line.split()[1])
+        except (IndexError, ValueError):
+            raise ValueError(f'Bad status line {status_line!r}') from None
+        response = {}
+        while True:
+            line = await self.readline(reader)
+            if not line:
+                return status, response
+            name, _, value = line.partition(':')
+            response[name.strip().lower()] = value.strip()
+
+    async def read_body(self, reader, response, body):
+        if response.get('transfer-encoding', '').lower() == 'chunked':
+            while True:
+                size = int((await self.readline(reader)).split(';')[0], 16)
+                if size == 0:
+                    while await self.readline(reader):
+                        pass
+                    return
+                await self.read_exactly(reader, size, body)
+                await self.readline(reader)
+        elif 'content-length' in response:
+            await self.read_exactly(reader, int(response['content-length']), body)
+        else:
+            while True:
+                chunk = await asyncio.wait_for(reader.read(CHUNK_BYTES), self.timeout)
+                if not chunk:
+                    return
+                body.write(chunk)
+
+    async def read_exactly(self, reader, size, body):
+        while size > 0:
+            chunk = await asyncio.wait_for(reader.read(min(size, CHUNK_BYTES)), self.timeout)
+            if not chunk:
+                raise ValueError('Connection closed early')
+            body.write(chunk)
+            size -= len(chunk)
+
+
+# Reads the validators saved by `save_state()`, if there are any.
+def load_state(filename):
+    try:
+        with open(filename) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+# Saves the validators from `results` for the next run, keeping any
+# from earlier runs for sources that couldn’t be checked this time.
+def save_state(filename, state, results):
+    state = dict(state)
+    for result in results:
+        if result.status != 'error':
+            state[result.url] = {
+                'etag': result.etag,
+                'last_modified': result.last_modified,
+                'sha256': result.sha256,
+                'checked': datetime.now(tz=timezone.utc).isoformat(timespec='seconds'),
+            }
+    with open(filename, 'w') as f:
+        json.dump(state, f, indent=2, sort_keys=True)
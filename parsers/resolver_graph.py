@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+
+from collections import deque
+
+
+class ResolverGraph(object):
+    """
+    The dependencies between attribute definitions and data connectors
+    in the attribute resolver files, built from the stanzas of an
+    `AttributeResolverConfig`.
+
+    Nodes are put in dependency order once, with Kahn’s algorithm, which
+    also finds any that are part of (or depend on) a cycle. The transitive
+    closure is kept only for data connectors: the connectors each node
+    relies on are computed the first time they are asked for, reusing
+    those of the nodes it depends on. There are few connectors, so this
+    stays proportional to the size of the graph, unlike the full closure
+    of a long chain of attribute definitions.
+    """
+
+    def __init__(self, stanzas):
+        self.stanzas = stanzas
+        # {id: [ids it depends on]}, and the reverse.
+        self.edges = {}
+        self.dependents = {id: [] for id in stanzas}
+        # {id: [refs to ids that don’t exist]}, with '(no ref)' for an
+        # element that has no `ref` at all.
+        self.missing = {}
+        for id, stanza in stanzas.items():
+            refs = list(stanza['dependencies'])
+            if stanza['failover']:
+                refs.append(stanza['failover'])
+            self.edges[id] = []
+            for ref in refs:
+                if ref is None:
+                    self.missing.setdefault(id, []).append('(no ref)')
+                elif ref not in stanzas:
+                    self.missing.setdefault(id, []).append(ref)
+                elif ref not in self.edges[id]:
+                    self.edges[id].append(ref)
+                    self.dependents[ref].append(id)
+        self.order, self.cycles = self.sort()
+        self.closure = {}
+
+    # Returns the ids in dependency order, and the set of ids that can’t
+    # be ordered because they are in, or depend on, a cycle.
+    def sort(self):
+        waiting = {id: len(deps) for id, deps in self.edges.items()}
+        ready = deque(id for id, count in waiting.items() if count == 0)
+        order = []
+        while ready:
+            id = ready.popleft()
+            order.append(id)
+            for dependent in self.dependents[id]:
+                waiting[dependent] -= 1
+                if waiting[dependent] == 0:
+                    ready.append(dependent)
+        cycles = set(self.edges) - set(order)
+        return order, cycles
+
+    def is_attribute(self, id):
+        return self.stanzas[id]['kind'] == 'AttributeDefinition'
+
+    def is_connector(self, id):
+        return self.stanzas[id]['kind'] == 'DataConnector'
+
+    # Returns the set of data connectors that `id` relies on, directly
+    # or through other attributes and connectors.
+    def connector_closure(self, id):
+        if id in self.closure:
+            return self.closure[id]
+        if id in self.cycles:
+            # Follow the edges without caching, since a cycle has no order.
+            seen = set()
+            stack = [id]
+            while stack:
+                for dep in self.edges[stack.pop()]:
+                    if dep not in seen:
+                        seen.add(dep)
+                        stack.append(dep)
+            return frozenset(dep for dep in seen if self.is_connector(dep))
+        # Fill in the closure for the dependencies first.
+        stack = [id]
+        while stack:
+            top = stack[-1]
+            pending = [dep for dep in self.edges[top] if dep not in self.closure]
+            if pending:
+                stack.extend(pending)
+                continue
+            stack.pop()
+            if top not in self.closure:
+                connectors = {dep for dep in self.edges[top] if self.is_connector(dep)}
+                for dep in self.edges[top]:
+                    connectors |= self.closure[dep]
+                self.closure[top] = frozenset(connectors)
+        return self.closure[id]
+
+    # Returns the data connectors an attribute (or connector) relies on.
+    def connectors_for(self, id):
+        return sorted(self.connector_closure(id))
+
+    # Returns the attributes that can’t be resolved if `connector` is
+    # down. Connectors with a failover connector that still works, and
+    # everything that relies only on them, aren’t affected.
+    def affected_by(self, connector):
+        failover = self.stanzas[connector]['failover']
+        if failover and failover != connector and connector not in self.connector_closure(failover):
+            return []
+        # Follow the reverse edges from the connector, over every node
+        # (cycles included, which have no place in `self.order`). A node
+        # is checked again whenever one of its dependencies breaks, since
+        # that may be its failover.
+        broken = {connector}
+        pending = deque(self.dependents[connector])
+        while pending:
+            id = pending.popleft()
+            if id in broken:
+                continue
+            failover = self.stanzas[id]['failover']
+            if not any(dep in broken for dep in self.edges[id] if dep != failover):
+                continue
+            if failover and failover not in broken:
+                continue
+            broken.add(id)
+            pending.extend(self.dependents[id])
+        return sorted(id for id in broken if self.is_attribute(id))
+
+    # Returns {id: reason} for every id that can’t be resolved: those with
+    # missing references or in cycles, and everything that relies on them.
+    def problems(self):
+        broken = {}
+        for id, refs in self.missing.items():
+            broken[id] = f'depends on missing {", ".join(refs)}'
+        for id in sorted(self.cycles):
+            broken[id] = 'is in, or depends on, a dependency cycle'
+        for id in self.order:
+            if id in broken:
+                continue
+            for dep in self.edges[id]:
+                if dep in broken:
+                    broken[id] = f'depends on {dep}, which can’t be resolved'
+                    break
+        return broken
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+
+# Queries the IdP’s `/idp/profile/admin/resolvertest` endpoint, as
+# `attributes.py` does, so the query daemon can answer the same requests.
+
+import json
+
+
+# Returns only attribute names and values from the JSON output,
+# sorted by name.
+def format_easy(input=''):
+    parsed = json.loads(input)
+    attrib_list = parsed['attributes']
+    attrib_dict = {}
+    max_length = 0
+    for attrib in attrib_list:
+        if len(attrib['values']) == 1:
+            attrib_dict[attrib['name']] = attrib['values'][0]
+        else:
+            attrib_dict[attrib['name']] = attrib['values']
+        if len(attrib['name']) > max_length:
+            max_length = len(attrib['name'])
+    output = []
+    for key in sorted(attrib_dict):
+        output.append(f'{key:{max_length}} = {attrib_dict[key]}')
+    return "\n".join(output)
+
+
+# Returns the IdP’s response for the principal and requester in the
+# given format (`saml1`, `saml2`, `json`, or `easy`). Requester `test`
+# means the `test-sp` from config, shown in `easy` format.
+# Raises json.JSONDecodeError if `easy` output can’t be parsed. Pass the
+# SSL `context` from `make_context()` to reuse it across queries.
+def resolver_test(config, principal, requester, format='saml2', context=None):
+    # Deferred because ssl and urllib.request are slow to import.
+    import socket
+    import urllib.parse
+    import urllib.request
+
+    hostname = config.get('hostname') or socket.getfqdn()
+    base = f"https://{hostname}/idp/profile/admin/resolvertest"
+    easy = format == 'easy' or requester == 'test'
+    if format == 'easy':
+        format = 'json'
+    if requester == 'test' and 'test-sp' in config:
+        requester = config['test-sp']
+        format = 'json'
+    query = {
+        'principal': principal,
+        'requester': requester,
+        format: True,
+    }
+    url = f'{base}?{urllib.parse.urlencode(query)}'
+
+    if context is None:
+        context = make_context()
+    response = urllib.request.urlopen(url, context=context)
+    result = response.read().decode()
+    if easy:
+        result = format_easy(result)
+    return result
+
+
+# Returns the SSL context for talking to the IdP, which may have a
+# self-signed certificate.
+def make_context():
+    import ssl
+
+    context = ssl.create_default_context()
+    context.verify_mode = ssl.CERT_OPTIONAL
+    context.check_hostname = False
+    return context
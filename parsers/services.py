@@ -10,9 +10,10 @@ class ServicesConfig(_ConfigFile):
     """
     # Inherited variables:
     #     PATH_SUB = re.compile(...)
+    #     TAGS = {...}
     #     XMLNS = {...}
     # Inherited methods:
-    #     __init__(self, config, filenames)
+    #     __init__(self, config, filenames, stats=None)
     #     load_stanzas(self, filename)
     #     make_path(self, text)
     #     translate_config(self)
@@ -34,8 +35,9 @@ class ServicesConfig(_ConfigFile):
         if stanza.tag != self.xmlns('util', 'list'):
             return []
         values = []
+        value_tag = self.xmlns('beans', 'value')
         for value in stanza:
-            if value.tag != self.xmlns('beans', 'value'):
+            if value.tag != value_tag:
                 continue
             text = value.text
             if '/system/' in text:
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+
+from collections import OrderedDict
+from datetime import timedelta
+
+
+class _Login(object):
+    __slots__ = ['time', 'used']
+
+    def __init__(self, time):
+        self.time = time
+        # Whether an SSO event has already been matched to this login.
+        self.used = False
+
+
+class SessionTracker(object):
+    """
+    Follows IdP sessions through the log, to tell whether each SSO event
+    came straight after a password login ('fresh'), reused a session
+    from an earlier login ('reuse'), or has no login within the session
+    lifetime to match it to ('unmatched', e.g. a session started before
+    the log does, or on another node).
+
+    Each SSO event is matched to the most recent successful login by its
+    principal no more than `lifetime` minutes before it, or, failing
+    that, to the most recent one from its IP address (in case the audit
+    log names the principal differently from the login form). The first
+    event matched to a login is fresh, and any after it are reuse.
+
+    Only the latest login per principal and per IP address is kept, in
+    time order, so logins older than the lifetime are dropped as time
+    moves on, and the oldest are dropped if there are more than
+    `max_keys`. Lines must be given in (roughly) time order.
+    """
+
+    def __init__(self, lifetime=60, max_keys=100000):
+        self.lifetime = timedelta(minutes=lifetime)
+        self.max_keys = max_keys
+        self.logins = {'principal': OrderedDict(), 'ip': OrderedDict()}
+        self.evicted = 0
+
+    # Starts a session for a successful Login event.
+    def login(self, event):
+        if not event.success:
+            return
+        login = _Login(event.time)
+        for kind, key in [('principal', event.user), ('ip', event.ip_addr)]:
+            if key is None:
+                continue
+            logins = self.logins[kind]
+            logins[key] = login
+            logins.move_to_end(key)
+            self.evict(logins, event.time)
+
+    # Returns 'fresh', 'reuse', or 'unmatched' for an SSO (Attribute)
+    # event.
+    def classify(self, event):
+        login = self.match('principal', event.user, event.time)
+        if login is None:
+            login = self.match('ip', event.ip_addr, event.time)
+        if login is None:
+            return 'unmatched'
+        if login.used:
+            return 'reuse'
+        login.used = True
+        return 'fresh'
+
+    def match(self, kind, key, time):
+        login = self.logins[kind].get(key)
+        if login is None or login.time > time or time - login.time > self.lifetime:
+            return None
+        return login
+
+    # Drops logins older than the lifetime, and the oldest if there are
+    # too many.
+    def evict(self, logins, time):
+        while logins:
+            key, oldest = next(iter(logins.items()))
+            if time - oldest.time <= self.lifetime and len(logins) <= self.max_keys:
+                break
+            del logins[key]
+            self.evicted += 1
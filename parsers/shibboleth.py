@@ -3,10 +3,26 @@
 from collections import Counter
 from datetime import datetime
 from ._logfile import _LogEvent, _LogFile
-import csv
-import os
+import json
 import re
-import sys
+
+
+# Version of the files written by `ShibbolethLog.save_partial()`.
+PARTIAL_VERSION = 1
+
+
+# Reads a partial file written by `ShibbolethLog.save_partial()`.
+def read_partial(filename):
+    import gzip
+
+    with gzip.open(filename, 'rt', encoding='utf-8') as f:
+        partial = json.load(f)
+    if partial.get('format') != 'idp-utilities-partial':
+        raise ValueError(f'{filename} is not a logscan partial file')
+    if partial.get('version') != PARTIAL_VERSION:
+        raise ValueError(f'{filename} has unsupported version {partial.get("version")}')
+    partial['filename'] = filename
+    return partial
 
 
 class ShibbolethEvent(_LogEvent):
@@ -35,16 +51,65 @@ class ShibbolethLog(_LogFile):
     #     2: Status: one of 'succeeded', 'failed', 'produced exception'
     LOGIN_REGEX = r"^Credential Validator ldap: Login by '?(.*?)'? (.*)$"
 
-    # Inherited variable:
+    # Regex match groups:
+    #     1: Datetime with milliseconds as string, which sorts in time order
+    TIME_REGEX = r'^(\d{4}-\d\d-\d\d \d\d:\d\d:\d\d,\d{3}) '
+
+    # Template for detail entries in the default `text` format.
+    ENTRY_TEMPLATE = '{0}  {1:15s}  {2:12s} {3}'
+
+    # Inherited variables:
+    #     PATTERNS = {...}
     #     SEQUENCE_CLASS = _LogSequence
     # Inherited methods:
     #     __init__(self, filename='', **kwargs)
+    #     compile_patterns(cls)
     #     find_sequences(self, index_attr='ip_addr')
     #     import_log(self, logfile)
     #     load(self, filename)
+    #     load_all(self, filenames, follow=False)
+    #     load_new(self, filename)
+    #     load_reader(self, reader, coverage=None)
+    #     trim_lines(self, lines, count)
 
     def __init__(self, filename='', **kwargs):
+        self.approximate = None
+        self.sketch_in = []
+        self.sketch_out = None
+        self.format = None
+        self.compress = None
+        self.partial = None
+        self.detect = False
+        self.window = 10
+        self.ip_threshold = 20
+        self.principal_threshold = 5
+        self.sso = False
+        self.session_minutes = 60
+        self.aggregate = False
+        self.sinks = {}
+        self.entries = []
         super().__init__(filename=filename, **kwargs)
+        if self.approximate:
+            from .sketches import UsageSketch
+            self.sketch = UsageSketch(self.approximate)
+        if self.detect:
+            from .detector import FailureDetector
+            self.detector = FailureDetector(
+                self.output_alert,
+                window=self.window,
+                ip_threshold=self.ip_threshold,
+                principal_threshold=self.principal_threshold)
+        if self.sso:
+            from .sessions import SessionTracker
+            self.sessions = SessionTracker(self.session_minutes)
+            # {(requester, date): Counter of 'fresh', 'reuse', 'unmatched'}
+            self.reuse = {}
+        if self.aggregate:
+            # {filename: {(principal, requester, date): logins}}
+            self.totals = {}
+            # {filename: {(principal, requester): Counter of (time, IP address)}}
+            self.details = {}
+            self.aggregated = 0
         if self.daily:
             self.dates = Counter()
             self.principals = {}
@@ -53,8 +118,13 @@ class ShibbolethLog(_LogFile):
             self.principals = Counter()
             self.requesters = Counter()
 
-    # TODO: add SSO back in
     def command_scan(self):
+        self.count_events()
+        self.output_results()
+
+    # Counts the parsed events, or collects their detail entries if both
+    # -n and -r are given.
+    def count_events(self):
         # Figure out what we’re counting and how to count it.
         dash_n = self.principal is not None
         dash_r = self.requester is not None
@@ -65,9 +135,14 @@ class ShibbolethLog(_LogFile):
             action = 'count_requester'
         elif dash_r and not dash_n:
             action = 'count_principal'
+        elif self.partial:
+            action = 'collect_entry'
         else:
             action = 'output_entry'
 
+        if self.approximate:
+            action = 'count_approximate'
+
         count = getattr(self, action)
 
         # Actually run the counts.
@@ -76,16 +151,144 @@ class ShibbolethLog(_LogFile):
                 continue
             count(event)
 
-        # Output the results if we haven’t already
-        if not dash_r:
-            self.output_data('requesters')
-        if not dash_n:
-            self.output_data('principals')
+    # Writes the counts, or any detail entries merged from partial files.
+    def output_results(self):
+        dash_n = self.principal is not None
+        dash_r = self.requester is not None
+
+        if self.sso:
+            self.output_sso()
+        elif self.approximate:
+            for filename in self.sketch_in:
+                self.merge_sketch(filename)
+            if self.sketch_out:
+                self.save_sketch(self.sketch_out)
+            self.output_sketch(dash_n, dash_r)
+        elif dash_n and dash_r:
+            # Entries from several partial files, interleaved by time.
+            for row in sorted(self.entries, key=lambda x: x[0]):
+                self.write_entry(row)
+        else:
+            # Output the results if we haven’t already
+            if not dash_r:
+                self.output_data('requesters')
+            if not dash_n:
+                self.output_data('principals')
+        self.close_outputs()
+
+    # Counts from another log’s `totals` and `details` (kept per file
+    # with `aggregate`, as by the query daemon), applying this log’s -n/-r
+    # filters the way `make_event()` does while parsing, so that
+    # `output_results()` reports what a scan of the same lines would.
+    def count_aggregates(self, totals, details):
+        dash_n = self.principal is not None
+        dash_r = self.requester is not None
+
+        if dash_n and dash_r:
+            # Entries for the pairs asked for, in time order.
+            entries = []
+            for file_details in details.values():
+                for (principal, requester), logins in file_details.items():
+                    if principal in self.principal and requester in self.requester:
+                        for (time, ip_addr), n in logins.items():
+                            entries.extend([[time, ip_addr, principal, requester]] * n)
+            for row in sorted(entries, key=lambda x: x[0]):
+                self.write_entry(row)
+            return
+
+        for file_totals in totals.values():
+            for (principal, requester, date), logins in file_totals.items():
+                if dash_n and principal not in self.principal:
+                    continue
+                if dash_r and requester not in self.requester:
+                    continue
+                if not dash_n:
+                    self.add_count('principals', principal, date, logins)
+                if not dash_r:
+                    self.add_count('requesters', requester, date, logins)
+
+    def add_count(self, subject, datum, date, logins):
+        store = getattr(self, subject)
+        if not self.daily:
+            store[datum] += logins
+            return
+        if datum not in store:
+            store[datum] = Counter()
+        store[datum][date] += logins
+        self.dates[date] += logins
+
+    # With both -n and -r, detail entries are written as they are parsed
+    # instead of being kept until `command_scan()`. When detecting failed
+    # logins, events go straight to the detector and aren’t kept at all,
+    # and likewise to the session tracker for --sso. With `aggregate`,
+    # only the counts and detail rows that queries need are kept.
+    def add_event(self, event):
+        if self.detect:
+            if event.type == 'Login':
+                self.detector.add(event)
+            return
+        if self.sso:
+            self.count_sso(event)
+            return
+        if self.aggregate:
+            if event.type == 'Attribute':
+                self.aggregate_event(event)
+            return
+        if (event.type == 'Attribute' and self.principal and self.requester
+                and not self.approximate and not self.partial):
+            self.output_entry(event)
+        else:
+            self.events.append(event)
+
+    def close_outputs(self):
+        for sink in self.sinks.values():
+            sink.close()
+        self.sinks = {}
+
+    def aggregate_event(self, event):
+        if self.loading not in self.totals:
+            self.totals[self.loading] = Counter()
+            self.details[self.loading] = {}
+        key = (event.user, event.entity_id)
+        self.totals[self.loading][key + (event.time.strftime('%Y-%m-%d'),)] += 1
+        details = self.details[self.loading]
+        if key not in details:
+            details[key] = Counter()
+        details[key][tuple(self.entry_row(event)[:2])] += 1
+        self.aggregated += 1
+
+    # Drops the counts from a file that is about to be read again.
+    def forget(self, filename):
+        if self.aggregate and filename in self.totals:
+            self.aggregated -= sum(self.totals.pop(filename).values())
+            del self.details[filename]
+
+    def collect_entry(self, e):
+        self.entries.append(self.entry_row(e))
 
     def count_both(self, event):
         self.count_event('principal', event)
         self.count_event('requester', event)
 
+    def count_approximate(self, event):
+        self.sketch.add(event.user, event.entity_id, event.time.strftime('%Y-%m-%d'))
+
+    # Classifies an SSO event as fresh, reuse, or unmatched, and counts
+    # it for its requester and day. Every requester’s events have to be
+    # classified, since any of them may have used the login first, but
+    # only those passing -r are counted.
+    def count_sso(self, event):
+        if event.type == 'Login':
+            self.sessions.login(event)
+            return
+        kind = self.sessions.classify(event)
+        if self.requester and event.entity_id not in self.requester:
+            return
+        key = (event.entity_id, event.time.strftime('%Y-%m-%d'))
+        if key not in self.reuse:
+            self.reuse[key] = Counter()
+        self.reuse[key][kind] += 1
+
     def count_daily(self, subject, event):
         store = getattr(self, f"{subject}s")
         datum = getattr(event, self.KEY_MAPPING[subject])
@@ -120,11 +323,13 @@ class ShibbolethLog(_LogFile):
         level = parse['level']
 
         if parse['module'].endswith('LDAPCredentialValidator'):
-            login = re.match(self.LOGIN_REGEX, parse['message'])
+            login = self.PATTERNS['LOGIN_REGEX'].match(parse['message'])
             if login is None:
                 print('ERROR: can’t parse message', parse.string)
+                self.stats.drop('parse_error')
                 return None
             if self.principal and login[1].lower() not in self.principal:
+                self.stats.drop('principal')
                 return None
             return ShibbolethEvent(
                 ip_addr=ip_addr,
@@ -137,8 +342,10 @@ class ShibbolethLog(_LogFile):
         if parse['module'] == 'Shibboleth-Audit.SSO':
             audit = parse['message'].split('|')
             if self.principal and audit[3].lower() not in self.principal:
+                self.stats.drop('principal')
                 return None
-            if self.requester and audit[4] not in self.requester:
+            if self.requester and not self.sso and audit[4] not in self.requester:
+                self.stats.drop('requester')
                 return None
             return ShibbolethEvent(
                 ip_addr=ip_addr,
@@ -150,15 +357,130 @@ class ShibbolethLog(_LogFile):
                 attributes=audit[8],
                 browser=audit[20],
                 audit=audit,
-                sso=(self.events[-1].type != 'Login'),
             )
         # print('Unknown log module:', parse['module'])
+        self.stats.drop('module')
         return None
 
-    def output_daily(self, data, f):
-        writer = csv.writer(f, delimiter=",")
+    def line_time(self, line):
+        match = self.PATTERNS['TIME_REGEX'].match(line)
+        return None if match is None else match[1]
+
+    # Builds a prefilter from the -n/-r filters (or for --detect, which
+    # only needs failed logins, or --sso, which only needs successful
+    # ones and every requester’s audit lines). Audit lines must contain
+    # one of the principals (case-insensitive, as `make_event()` lowercases
+    # them) and one of the requesters; LDAP login lines only need to match
+    # the principals, because they carry no requester. Everything else can
+    # never become an event and is rejected. This only has to be a superset
+    # of what `make_event()` keeps, so substring matches are enough.
+    def make_prefilter(self):
+        if not self.principal and not self.requester and not self.detect and not self.sso:
+            return None
+        principal = requester = None
+        if self.principal:
+            pattern = '|'.join(re.escape(p) for p in self.principal)
+            principal = re.compile(pattern, re.IGNORECASE).search
+        if self.requester and not self.sso:
+            pattern = '|'.join(re.escape(r) for r in self.requester)
+            requester = re.compile(pattern).search
+
+        if self.detect:
+            # Only failed logins matter; the status ends the line.
+            def prefilter(line):
+                if 'LDAPCredentialValidator' not in line or line.rstrip().endswith(' succeeded'):
+                    return False
+                return principal is None or principal(line) is not None
+
+            return prefilter
+
+        if self.sso:
+            def prefilter(line):
+                if 'Shibboleth-Audit.SSO' in line:
+                    return principal is None or principal(line) is not None
+                if 'LDAPCredentialValidator' not in line or not line.rstrip().endswith(' succeeded'):
+                    return False
+                return principal is None or principal(line) is not None
+
+            return prefilter
+
+        def prefilter(line):
+            if 'Shibboleth-Audit.SSO' in line:
+                if principal is not None and principal(line) is None:
+                    return False
+                return requester is None or requester(line) is not None
+            if 'LDAPCredentialValidator' in line:
+                return principal is None or principal(line) is not None
+            return False
+
+        return prefilter
+
+    # Returns the options that decide what a partial file holds; files
+    # can only be merged if they were scanned with the same options.
+    def partial_options(self):
+        return {
+            'principal': sorted(self.principal) if self.principal else None,
+            'requester': sorted(self.requester) if self.requester else None,
+            'daily': bool(self.daily),
+            'approximate': self.approximate,
+        }
+
+    # Adds the counts, entries, and sketch from a partial file (as read
+    # by `read_partial()`) to this log’s.
+    def merge_partial(self, partial):
+        if partial['options'] != self.partial_options():
+            raise ValueError(f'{partial["filename"]} was scanned with different -n, -r, -d, or -a options')
+        if self.approximate:
+            from .sketches import UsageSketch
+            self.sketch.merge(UsageSketch.from_dict(partial['sketch']))
+        elif self.daily:
+            self.dates.update(partial['dates'])
+            for subject in ['principals', 'requesters']:
+                store = getattr(self, subject)
+                for datum, counts in partial[subject].items():
+                    if datum not in store:
+                        store[datum] = Counter()
+                    store[datum].update(counts)
+        else:
+            self.principals.update(partial['principals'])
+            self.requesters.update(partial['requesters'])
+        self.entries.extend(partial['entries'])
+
+    # Writes the counts (after `count_events()`) to a compact partial
+    # file, to be combined with others by `merge_partial()`.
+    def save_partial(self, filename):
+        import gzip
+        import socket
+
+        partial = {
+            'format': 'idp-utilities-partial',
+            'version': PARTIAL_VERSION,
+            'host': socket.gethostname(),
+            'files': [f['filename'] for f in self.stats.files if 'skipped' not in f],
+            'options': self.partial_options(),
+            'dates': dict(self.dates) if self.daily else {},
+            'principals': self.principals,
+            'requesters': self.requesters,
+            'entries': self.entries,
+            'sketch': self.sketch.to_dict() if self.approximate else None,
+        }
+        with gzip.open(filename, 'wt', encoding='utf-8') as f:
+            json.dump(partial, f)
+
+    # Merges a sketch saved by `save_sketch()`, e.g. from a scan of other
+    # log files, into this one.
+    def merge_sketch(self, filename):
+        from .sketches import UsageSketch
+        with open(filename) as f:
+            self.sketch.merge(UsageSketch.from_dict(json.load(f)))
+
+    def save_sketch(self, filename):
+        with open(filename, 'w') as f:
+            json.dump(self.sketch.to_dict(), f)
+
+    def output_daily(self, subject, data):
         dates = sorted(self.dates.keys())
-        writer.writerow(['user'] + dates)
+        sink = self.open_sink(subject, ['user'] + dates, header=True)
         for user in sorted(data.keys()):
             row = [user]
             for date in dates:
@@ -166,29 +488,77 @@ class ShibbolethLog(_LogFile):
                     row.append(data[user][date])
                 else:
                     row.append(None)
-            writer.writerow(row)
+            sink.write(row)
 
     def output_data(self, subject):
-        f = sys.stdout
-        if self.output:
-            f = open(os.path.join(self.output, subject + '.csv'), 'w')
         data = getattr(self, subject)
         if self.daily:
-            self.output_daily(data, f)
+            self.output_daily(subject, data)
         else:
-            self.output_simple(data, f)
+            self.output_simple(subject, data)
+
+    def output_alert(self, time, kind, key, failures):
+        sink = self.open_sink('alerts', ['time', 'kind', 'key', 'failures', 'window_minutes'], header=True)
+        sink.write([str(time)[:19], kind, key, failures, self.window])
+        sink.flush()
+
+    # Writes the SSO counts for each requester and day, with the share
+    # of matched events that reused a session.
+    def output_sso(self):
+        self.stats.add('sso_sessions_evicted', self.sessions.evicted)
+        columns = ['requester', 'date', 'fresh', 'reuse', 'unmatched', 'reuse_rate']
+        sink = self.open_sink('sso', columns, header=True)
+        for (requester, date), counts in sorted(self.reuse.items()):
+            matched = counts['fresh'] + counts['reuse']
+            rate = round(counts['reuse'] / matched, 4) if matched else None
+            sink.write([requester, date, counts['fresh'], counts['reuse'], counts['unmatched'], rate])
 
     def output_entry(self, e):
-        f = sys.stdout
-        if self.output:
-            f = open(os.path.join(self.output, 'entries.log'), 'w')
-        time = e.time.strftime('%Y-%m-%d %H:%M:%S')
-        print(f"{time}  {e.ip_addr:15s}  {e.user:12s} {e.entity_id}", file=f)
-
-    def output_simple(self, data, f):
-        writer = csv.writer(f, delimiter=",")
-        for row in sorted(data.items(), key=lambda x: x[1], reverse=True):
-            writer.writerow(row)
+        self.write_entry(self.entry_row(e))
+
+    def entry_row(self, e):
+        return [str(e.time)[:19], e.ip_addr or '', e.user, e.entity_id]
+
+    def write_entry(self, row):
+        sink = self.sinks.get('entries')
+        if sink is None:
+            sink = self.open_sink('entries', ['time', 'ip_addr', 'user', 'entity_id'])
+        sink.write(row)
+
+    # Returns the sink for a report, opening it the first time. Detail
+    # entries default to the `text` format, everything else to `csv`.
+    def open_sink(self, subject, columns, header=False):
+        if subject not in self.sinks:
+            from .output import open_sink
+
+            format = self.format
+            template = None
+            if subject == 'entries' and format is None:
+                format = 'text'
+                template = self.ENTRY_TEMPLATE
+            self.sinks[subject] = open_sink(
+                self.output, subject, format or 'csv', columns, header, template, self.compress)
+        return self.sinks[subject]
+
+    # Writes the approximate counts, each followed by its error bound:
+    # Space-Saving counts are at most `max_overcount` too high, and
+    # HyperLogLog estimates have the given standard error.
+    def output_sketch(self, dash_n, dash_r):
+        tops = []
+        if not dash_r:
+            tops.append(('requesters', 'requester', self.sketch.requesters))
+        if not dash_n:
+            tops.append(('principals', 'principal', self.sketch.principals))
+        for subject, column, top in tops:
+            sink = self.open_sink(subject, [column, 'logins', 'max_overcount'], header=True)
+            sink.writerows(top.top())
+        sink = self.open_sink('distinct', ['requester', 'date', 'principals', 'std_error'], header=True)
+        for (requester, date), hll in sorted(self.sketch.distinct.items()):
+            sink.write([requester, date, hll.estimate(), hll.error()])
+
+    def output_simple(self, subject, data):
+        sink = self.open_sink(subject, [subject[:-1], 'count'])
+        sink.writerows(sorted(data.items(), key=lambda x: x[1], reverse=True))
 
     def validate_line(self, parse):
         if parse['message'] == "Ignoring NameIDFormat metadata that includes the 'unspecified' format":
@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+
+# Fixed-size approximate counters for `logscan.py -a`, for reports over
+# more principals, requesters, and days than we want to count exactly.
+# Every sketch can be saved with `to_dict()`, loaded with `from_dict()`,
+# and combined with another of the same size with `merge()`.
+
+from collections import Counter
+import base64
+import hashlib
+import math
+
+
+# Returns a 64-bit hash of a string, the same in every run.
+def hash64(value):
+    digest = hashlib.blake2b(value.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, 'big')
+
+
+class HyperLogLog(object):
+    """
+    Estimates the number of distinct values added to it, using 2**p
+    one-byte registers, with a relative standard error of 1.04/sqrt(2**p).
+
+    While few values have been added it keeps their hashes instead, which
+    is exact and uses less memory; it switches to registers once that
+    would take more space than the registers do.
+    """
+
+    def __init__(self, p=10):
+        self.p = p
+        self.m = 1 << p
+        self.hashes = set()
+        self.registers = None
+
+    def add(self, value):
+        self.add_hash(hash64(value))
+
+    def add_hash(self, hashed):
+        if self.registers is None:
+            self.hashes.add(hashed)
+            if len(self.hashes) > self.m // 16:
+                self.densify()
+            return
+        index = hashed & (self.m - 1)
+        rank = 64 - self.p - (hashed >> self.p).bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def densify(self):
+        self.registers = bytearray(self.m)
+        hashes, self.hashes = self.hashes, set()
+        for hashed in hashes:
+            self.add_hash(hashed)
+
+    # Returns the estimated number of distinct values.
+    def estimate(self):
+        if self.registers is None:
+            return len(self.hashes)
+        m = self.m
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            # Small-range correction (linear counting).
+            estimate = m * math.log(m / zeros)
+        return round(estimate)
+
+    # Returns the standard error of `estimate()`, which is zero while
+    # it is still counting exactly.
+    def error(self):
+        if self.registers is None:
+            return 0
+        return round(1.04 / math.sqrt(self.m) * self.estimate())
+
+    def merge(self, other):
+        if other.p != self.p:
+            raise ValueError(f'Can’t merge HyperLogLog with p={other.p} into p={self.p}')
+        if other.registers is None:
+            for hashed in other.hashes:
+                self.add_hash(hashed)
+            return self
+        if self.registers is None:
+            self.densify()
+        self.registers = bytearray(max(a, b) for a, b in zip(self.registers, other.registers))
+        return self
+
+    def to_dict(self):
+        if self.registers is None:
+            return {'p': self.p, 'hashes': sorted(self.hashes)}
+        return {'p': self.p, 'registers': base64.b64encode(bytes(self.registers)).decode()}
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(data['p'])
+        if 'registers' in data:
+            sketch.registers = bytearray(base64.b64decode(data['registers']))
+        else:
+            sketch.hashes = set(data['hashes'])
+        return sketch
+
+
+class SpaceSaving(object):
+    """
+    Finds the (approximately) most frequent of the values added to it,
+    keeping at most `k` counters. Any value seen more than total/k times
+    is always kept, and each count is at most `errors[value]` too high.
+    """
+
+    def __init__(self, k=50):
+        self.k = k
+        self.counts = {}
+        self.errors = {}
+        self.total = 0
+
+    def add(self, value, count=1):
+        self.total += count
+        if value in self.counts:
+            self.counts[value] += count
+            return
+        if len(self.counts) < self.k:
+            self.counts[value] = count
+            self.errors[value] = 0
+            return
+        # Replace the smallest counter; the new value might have been
+        # counted that many times before it was evicted.
+        evicted = min(self.counts, key=self.counts.get)
+        floor = self.counts.pop(evicted)
+        del self.errors[evicted]
+        self.counts[value] = floor + count
+        self.errors[value] = floor
+
+    # Returns the smallest count that an unlisted value could have.
+    def floor(self):
+        if len(self.counts) < self.k:
+            return 0
+        return min(self.counts.values())
+
+    # Merges another sketch into this one, as described by Agarwal et al.,
+    # “Mergeable Summaries” (2012): values missing from one side are
+    # assumed to have that side’s floor count, then the top k are kept.
+    def merge(self, other):
+        if other.k != self.k:
+            raise ValueError(f'Can’t merge SpaceSaving with k={other.k} into k={self.k}')
+        floor, other_floor = self.floor(), other.floor()
+        counts = {}
+        errors = {}
+        for value in set(self.counts) | set(other.counts):
+            counts[value] = self.counts.get(value, floor) + other.counts.get(value, other_floor)
+            errors[value] = self.errors.get(value, floor) + other.errors.get(value, other_floor)
+        top = sorted(counts, key=counts.get, reverse=True)[:self.k]
+        self.counts = {value: counts[value] for value in top}
+        self.errors = {value: errors[value] for value in top}
+        self.total += other.total
+        return self
+
+    # Returns [(value, count, error)] with the highest counts first, and
+    # ties in order of value.
+    def top(self):
+        ranked = sorted(self.counts.items(), key=lambda x: (-x[1], x[0]))
+        return [(value, count, self.errors[value]) for value, count in ranked]
+
+    def to_dict(self):
+        return {
+            'k': self.k,
+            'total': self.total,
+            'counts': self.counts,
+            'errors': self.errors,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(data['k'])
+        sketch.total = data['total']
+        sketch.counts = dict(data['counts'])
+        sketch.errors = dict(data['errors'])
+        return sketch
+
+
+class UsageSketch(object):
+    """
+    The approximate counts behind `logscan.py -a`: the top principals
+    and requesters by number of logins, and the number of distinct
+    principals per requester per day.
+    """
+
+    VERSION = 1
+
+    def __init__(self, k=50, p=10):
+        self.k = k
+        self.p = p
+        self.principals = SpaceSaving(k)
+        self.requesters = SpaceSaving(k)
+        self.distinct = {}
+        self.dates = Counter()
+
+    def add(self, principal, requester, date):
+        self.principals.add(principal)
+        self.requesters.add(requester)
+        self.dates[date] += 1
+        key = (requester, date)
+        if key not in self.distinct:
+            self.distinct[key] = HyperLogLog(self.p)
+        self.distinct[key].add(principal)
+
+    def merge(self, other):
+        self.principals.merge(other.principals)
+        self.requesters.merge(other.requesters)
+        self.dates.update(other.dates)
+        for key, sketch in other.distinct.items():
+            if key in self.distinct:
+                self.distinct[key].merge(sketch)
+            else:
+                self.distinct[key] = HyperLogLog(self.p).merge(sketch)
+        return self
+
+    def to_dict(self):
+        return {
+            'version': self.VERSION,
+            'k': self.k,
+            'p': self.p,
+            'principals': self.principals.to_dict(),
+            'requesters': self.requesters.to_dict(),
+            'dates': dict(self.dates),
+            'distinct': [[requester, date, sketch.to_dict()]
+                         for (requester, date), sketch in self.distinct.items()],
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        if data.get('version') != cls.VERSION:
+            raise ValueError(f'Unknown sketch version {data.get("version")}')
+        sketch = cls(data['k'], data['p'])
+        sketch.principals = SpaceSaving.from_dict(data['principals'])
+        sketch.requesters = SpaceSaving.from_dict(data['requesters'])
+        sketch.dates = Counter(data['dates'])
+        for requester, date, distinct in data['distinct']:
+            sketch.distinct[(requester, date)] = HyperLogLog.from_dict(distinct)
+        return sketch
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+import json
+import sys
+import time
+
+
+class _Phase(object):
+    def __init__(self, stats, name):
+        self.stats = stats
+        self.name = name
+
+    def __enter__(self):
+        self.wall = time.perf_counter()
+        self.cpu = time.thread_time()
+        return self
+
+    def __exit__(self, *exc):
+        phase = self.stats.phases.setdefault(self.name, {'wall': 0.0, 'cpu': 0.0, 'calls': 0})
+        phase['wall'] += time.perf_counter() - self.wall
+        phase['cpu'] += time.thread_time() - self.cpu
+        phase['calls'] += 1
+        return False
+
+
+class RunStats(object):
+    """
+    Counters and phase timings collected while parsing logs or config
+    files, shared by `_LogFile` and `_ConfigFile` objects in the same run.
+
+    Counters are always kept because they are cheap; phase timing is only
+    done when `enabled` is true, so a disabled instance adds no more than
+    a method call per phase.
+    """
+
+    def __init__(self, enabled=True, verbose=False):
+        self.enabled = enabled
+        self.verbose = verbose
+        self.counts = Counter()
+        self.dropped = Counter()
+        self.files = []
+        # Records in `files` of files processed, by filename.
+        self.processed = {}
+        self.phases = {}
+
+    def add(self, key, value=1):
+        self.counts[key] += value
+
+    def as_dict(self):
+        return {
+            'counts': dict(self.counts),
+            'dropped': dict(self.dropped),
+            'files': self.files,
+            'phases': self.phases,
+        }
+
+    # Records a line that was dropped, and why.
+    def drop(self, reason):
+        self.dropped[reason] += 1
+
+    # Records a summary of one processed file. A file processed again
+    # (e.g. new lines in a followed log) adds to its earlier record:
+    # numbers are summed and anything else is replaced.
+    def file(self, filename, **kwargs):
+        filename = str(filename)
+        record = self.processed.get(filename)
+        if record is None:
+            self.counts['files'] += 1
+            record = self.processed[filename] = dict(filename=filename, **kwargs)
+            self.files.append(record)
+            return
+        for key, value in kwargs.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool) and key in record:
+                record[key] += value
+            else:
+                record[key] = value
+
+    # Records a file that wasn’t processed, and why.
+    def skip_file(self, filename, reason, **kwargs):
+        self.counts['files_skipped'] += 1
+        self.counts[f'skipped_{reason}'] += 1
+        self.files.append(dict(filename=str(filename), skipped=reason, **kwargs))
+
+    # Returns a context manager that times the enclosed block.
+    # Phases with the same name accumulate; nested phases are inclusive.
+    # CPU time is the current thread’s, so it leaves out work done at the
+    # same time by the reader’s prefetch thread, which records its own.
+    def phase(self, name):
+        if not self.enabled:
+            return nullcontext()
+        return _Phase(self, name)
+
+    # Prints a progress message to stderr if verbose.
+    def progress(self, message):
+        if self.verbose:
+            print(message, file=sys.stderr)
+
+    # Writes the report as JSON to the given filename, or stderr for '-'.
+    def write(self, filename):
+        if filename == '-':
+            json.dump(self.as_dict(), sys.stderr, indent=2)
+            print(file=sys.stderr)
+            return
+        with open(filename, 'w') as f:
+            json.dump(self.as_dict(), f, indent=2)
+
+
+# Runs the enclosed block under cProfile and writes the results to the
+# given filename for `pstats` or snakeviz; does nothing if it is None.
+@contextmanager
+def profiled(filename):
+    if not filename:
+        yield
+        return
+    import cProfile
+    profile = cProfile.Profile()
+    profile.enable()
+    try:
+        yield
+    finally:
+        profile.disable()
+        profile.dump_stats(filename)
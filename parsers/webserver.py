@@ -1,6 +1,5 @@
 #!/usr/bin/env python3
 
-import re
 from datetime import datetime
 from urllib.parse import parse_qs
 from ._logfile import _LogEvent, _LogSequence, _LogFile
@@ -63,6 +62,10 @@ class WebserverLog(_LogFile):
 
     SAML2_REGEX = r'^/idp/profile/SAML2/(Redirect|POST)/(S[LS]O)(?:\?(.*))?$'
 
+    # Regex match groups:
+    #     1: Datetime as string
+    TIME_REGEX = r'^\S+ \S+ \S+ \[(.*?)\]'
+
     SKIP_PAGES = [
         '/',
         '/favicon.ico',
@@ -75,16 +78,27 @@ class WebserverLog(_LogFile):
         '/robots.txt',
     ]
 
+    # Inherited variable:
+    #     PATTERNS = {...}
     # Inherited methods:
     #     __init__(self, filename='', **kwargs)
+    #     add_event(self, event)
+    #     compile_patterns(cls)
     #     find_sequences(self, index_attr='ip_addr')
+    #     forget(self, filename)
     #     import_log(self, logfile)
     #     load(self, filename)
+    #     load_all(self, filenames, follow=False)
+    #     load_new(self, filename)
+    #     load_reader(self, reader, coverage=None)
+    #     make_prefilter(self)
+    #     trim_lines(self, lines, count)
 
     def make_event(self, parse):
-        saml2 = re.match(self.SAML2_REGEX, parse[4])
+        saml2 = self.PATTERNS['SAML2_REGEX'].match(parse[4])
         if saml2 is None:
             print('ERROR: can’t parse', parse.string)
+            self.stats.drop('parse_error')
             return None
 
         request = saml2[1] + '/' + saml2[2]
@@ -108,6 +122,15 @@ class WebserverLog(_LogFile):
             browser=parse[8]
         )
 
+    def line_time(self, line):
+        match = self.PATTERNS['TIME_REGEX'].match(line)
+        if match is None:
+            return None
+        try:
+            return datetime.strptime(match[1], '%d/%b/%Y:%H:%M:%S %z')
+        except ValueError:
+            return None
+
     def validate_line(self, parse):
         if parse[4].split('?')[0] in self.SKIP_PAGES:
             return False
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+
+# Runs `MetadataRefreshChecker` against a local stand-in for metadata
+# servers. Run with `python -m unittest discover tests`.
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+import hashlib
+import os
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from parsers.refresh import MetadataRefreshChecker  # noqa: E402
+
+METADATA = b'''<?xml version="1.0"?>
+<EntitiesDescriptor xmlns="urn:oasis:names:tc:SAML:2.0:metadata" validUntil="2030-01-01T00:00:00Z">
+  <EntityDescriptor entityID="https://sp1.example.edu/shibboleth"/>
+  <EntityDescriptor entityID="https://sp2.example.edu/shibboleth"/>
+</EntitiesDescriptor>
+'''
+ETAG = '"v1"'
+LAST_MODIFIED = 'Mon, 01 Jan 2024 00:00:00 GMT'
+
+
+class _StandIn(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        if self.path == '/md.xml':
+            if self.headers.get('If-None-Match') == ETAG:
+                self.send_response(304)
+                self.send_header('ETag', ETAG)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header('ETag', ETAG)
+            self.send_header('Last-Modified', LAST_MODIFIED)
+            self.send_header('Content-Length', str(len(METADATA)))
+            self.end_headers()
+            self.wfile.write(METADATA)
+        elif self.path == '/moved':
+            self.send_response(302)
+            self.send_header('Location', '/md.xml')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+        elif self.path == '/chunked':
+            self.send_response(200)
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            for i in range(0, len(METADATA), 50):
+                chunk = METADATA[i:i + 50]
+                self.wfile.write(b'%x\r\n%s\r\n' % (len(chunk), chunk))
+            self.wfile.write(b'0\r\n\r\n')
+        elif self.path == '/slow':
+            time.sleep(2)
+        else:
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class MetadataRefreshCheckerTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), _StandIn)
+        cls.server.daemon_threads = True
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.base = f'http://127.0.0.1:{cls.server.server_address[1]}'
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = self.tmp.name
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def backing_file(self, name, contents=METADATA):
+        filename = os.path.join(self.dir, name)
+        with open(filename, 'wb') as f:
+            f.write(contents)
+        return filename
+
+    def check(self, path, filename, **kwargs):
+        providers = {'md': {'url': self.base + path, 'filename': filename}}
+        return MetadataRefreshChecker(providers, **kwargs).run()[0]
+
+    def test_200_current(self):
+        result = self.check('/md.xml', self.backing_file('md.xml'))
+        self.assertEqual(result.status, 'current')
+        self.assertEqual(result.http_status, 200)
+        self.assertEqual(result.entities, 2)
+        self.assertEqual(result.valid_until, '2030-01-01T00:00:00Z')
+        self.assertEqual(result.etag, ETAG)
+
+    def test_200_stale_and_missing(self):
+        stale = self.check('/md.xml', self.backing_file('md.xml', b'<EntitiesDescriptor/>'))
+        self.assertEqual(stale.status, 'stale')
+        missing = self.check('/md.xml', os.path.join(self.dir, 'none.xml'))
+        self.assertEqual(missing.status, 'missing')
+
+    def test_304_with_saved_validators(self):
+        filename = self.backing_file('md.xml')
+        state = {self.base + '/md.xml': {
+            'etag': ETAG,
+            'last_modified': LAST_MODIFIED,
+            'sha256': hashlib.sha256(METADATA).hexdigest(),
+        }}
+        result = self.check('/md.xml', filename, state=state)
+        self.assertEqual(result.http_status, 304)
+        self.assertEqual(result.status, 'current')
+        self.assertEqual(result.last_modified, LAST_MODIFIED)
+
+    def test_validators_not_sent_for_changed_backing_file(self):
+        filename = self.backing_file('md.xml', b'<EntitiesDescriptor/>')
+        state = {self.base + '/md.xml': {'etag': ETAG, 'sha256': hashlib.sha256(METADATA).hexdigest()}}
+        result = self.check('/md.xml', filename, state=state)
+        self.assertEqual(result.http_status, 200)
+        self.assertEqual(result.status, 'stale')
+
+    def test_redirect(self):
+        result = self.check('/moved', self.backing_file('md.xml'))
+        self.assertEqual(result.http_status, 200)
+        self.assertEqual(result.status, 'current')
+
+    def test_chunked_download(self):
+        download = os.path.join(self.dir, 'download')
+        os.mkdir(download)
+        result = self.check('/chunked', os.path.join(self.dir, 'none.xml'), download=download)
+        self.assertEqual(result.status, 'missing')
+        self.assertEqual(result.entities, 2)
+        with open(result.downloaded, 'rb') as f:
+            self.assertEqual(f.read(), METADATA)
+        self.assertEqual(os.listdir(download), ['md-none.xml'])
+
+    def test_timeout(self):
+        result = self.check('/slow', self.backing_file('md.xml'), timeout=0.2)
+        self.assertEqual(result.status, 'error')
+
+    def test_http_error(self):
+        result = self.check('/nothing', self.backing_file('md.xml'))
+        self.assertEqual(result.status, 'error')
+        self.assertIn('404', result.error)
+
+
+if __name__ == '__main__':
+    unittest.main()